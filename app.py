@@ -1,9 +1,19 @@
-import requests
+import os
+import re
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
 import duckdb
 import streamlit as st
 import streamlit.components.v1 as components
+import pandas as pd
 import plotly.express as px
 
+import embed
+import metrics
+
 COLORS = {
 	"white": "#f3f4f6",
 	"blue": {
@@ -18,14 +28,22 @@ COLORS = {
 	}
 }
 
-con = duckdb.connect(database="./data/tweets_sentiment.duckdb", read_only=True)
-
-def show_kpis_combined():
-
-	st.header("Combined Party Sentiment Year-To-Date")
-	st.caption("Data only available through July 2023")
-
-	df = con.execute("""--sql
+DB_PATH = "./data/tweets_sentiment.duckdb"
+DB_ALIAS = "tweets_sentiment"
+QUERY_CACHE_TTL = 60 * 60
+QUERY_CACHE_MAX_ENTRIES = 512
+DUCKDB_THREADS = int(os.environ.get("DUCKDB_THREADS", 2))
+DUCKDB_MEMORY_LIMIT = os.environ.get("DUCKDB_MEMORY_LIMIT", "1GB")
+
+# Cursor checked out by the script run of the current thread, see database_cursor
+script_run = threading.local()
+
+# Dashboard queries, prepared once per cursor and executed with bound parameters.
+# dashboard_sentiment returns the filtered monthly rollups that every chart and account
+# leaderboard is computed from. The tweets by party queries pick the top tweets of each
+# party from the top tweets of each month and account type in extreme_tweets.
+QUERIES = {
+	"kpis_combined": """--sql
 		SELECT
 			CASE 
 				WHEN tweets.created_at BETWEEN '2023-01-01' AND '2023-07-21' THEN '2023'
@@ -38,11 +56,383 @@ def show_kpis_combined():
 			SUM(CASE WHEN sentiment < 0.05 AND sentiment > -0.05 THEN 1 ELSE 0 END) AS 'count_neu',
 			COUNT(*) AS 'count_total'
 		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party IN ('D', 'R')
+		WHERE party IN ('D', 'R')
 		GROUP BY Year
 		HAVING Year IN ('2022', '2023')
-	""").df()
+	""",
+	"dashboard_sentiment": """--sql
+		SELECT
+			monthly_sentiment.year_month,
+			CAST(monthly_sentiment.party AS VARCHAR) AS party,
+			CAST(monthly_sentiment.type AS VARCHAR) AS type,
+			accounts.name,
+			monthly_sentiment.sum_sentiment,
+			monthly_sentiment.count_tweets,
+			monthly_sentiment.count_pos,
+			monthly_sentiment.count_neg,
+			monthly_sentiment.count_neu
+		FROM monthly_sentiment
+			JOIN accounts ON accounts.account_key = monthly_sentiment.account_key
+		WHERE monthly_sentiment.party IN ('D', 'R')
+			AND monthly_sentiment.year_month BETWEEN $begin_month AND $end_month
+			AND list_contains(CAST($account_types AS account_type_enum[]), monthly_sentiment.type)
+	""",
+	"positive_tweets_by_party": """--sql
+		SELECT party, sentiment, text, link
+		FROM (
+			SELECT DISTINCT CAST(party AS VARCHAR) AS party, sentiment, text, link
+			FROM extreme_tweets
+			WHERE party IN ('D', 'R')
+				AND year_month BETWEEN $begin_month AND $end_month
+				AND list_contains(CAST($account_types AS account_type_enum[]), type)
+		)
+		QUALIFY ROW_NUMBER() OVER (PARTITION BY party ORDER BY sentiment DESC) <= 10
+		ORDER BY party, sentiment DESC
+	""",
+	"negative_tweets_by_party": """--sql
+		SELECT party, sentiment, text, link
+		FROM (
+			SELECT DISTINCT CAST(party AS VARCHAR) AS party, sentiment, text, link
+			FROM extreme_tweets
+			WHERE party IN ('D', 'R')
+				AND year_month BETWEEN $begin_month AND $end_month
+				AND list_contains(CAST($account_types AS account_type_enum[]), type)
+		)
+		QUALIFY ROW_NUMBER() OVER (PARTITION BY party ORDER BY sentiment ASC) <= 10
+		ORDER BY party, sentiment ASC
+	"""
+}
+
+# Names of the parameters each query binds
+QUERY_PARAMETERS = {name: set(re.findall(r"\$(\w+)", query)) for name, query in QUERIES.items()}
+
+def get_database_version():
+	"""
+	Returns the version of the database file. load_duckdb swaps in a new file on every
+	load, so its modification time changes whenever the data does. Cached query results
+	from an older version are cleared when a new version is seen.
+
+	Returns:
+		int: The modification time of the database file in nanoseconds
+	"""
+
+	query_cache = get_query_cache()
+	database_version = os.stat(DB_PATH).st_mtime_ns
+
+	if database_version != query_cache["database_version"]:
+		run_query.clear()
+		query_cache["database_version"] = database_version
+
+	return database_version
+
+@st.cache_resource
+def get_query_cache():
+	"""
+	Returns the state of the query cache shared by all sessions. Streamlit executes the
+	script again on every rerun, so it can't be kept in a module global.
+
+	Returns:
+		dict: The database version the query cache was filled from
+	"""
+
+	return {"database_version": None}
+
+def get_query_params(page_options):
+	"""
+	Returns the query parameters for the filters selected on the page.
+
+	Arguments:
+		page_options (dict): The filters selected in the sidebar
+	Returns:
+		dict: The month range and account types to filter on
+	"""
+
+	return {
+		"begin_month": int(page_options["begin_year"]) * 100 + 1,
+		"end_month": int(page_options["end_year"]) * 100 + 12,
+		"account_types": ["member"] if page_options["show_members_only"] else ["committee", "member", "caucus", "party"]
+	}
+
+def to_sql_literal(value):
+	"""
+	Formats a query parameter as an escaped SQL literal for EXECUTE.
+
+	Arguments:
+		value (str | int | float | bool | list): The parameter value
+	Returns:
+		str: The SQL literal
+	"""
+
+	if isinstance(value, bool):
+		return "TRUE" if value else "FALSE"
+	elif isinstance(value, (int, float)):
+		return repr(value)
+	elif isinstance(value, str):
+		return "'" + value.replace("'", "''") + "'"
+	elif isinstance(value, (list, tuple)):
+		return "[" + ", ".join(to_sql_literal(item) for item in value) + "]"
+
+	raise TypeError(f"Unsupported query parameter type: {type(value).__name__}")
+
+@st.cache_resource
+def get_open_databases():
+	"""
+	Returns the databases opened by get_database that are not closed yet, shared by all
+	sessions.
+
+	Returns:
+		list: The open databases, see get_database
+	"""
+
+	return []
+
+@st.cache_resource(max_entries=1)
+def get_database(database_version):
+	"""
+	Opens a read-only connection to the given version of the database, shared by all
+	sessions, along with a pool of cursors on it. Only the latest version is kept, the
+	previous versions are closed.
+
+	The file is attached to a new in-memory DuckDB instance rather than opened by path.
+	DuckDB returns the instance already open for a path as long as any of its connections
+	is alive, so opening the path would keep serving the file load_duckdb replaced.
+
+	Arguments:
+		database_version (int): The database version, see get_database_version
+	Returns:
+		dict: The shared connection, the pool of idle cursors, the names of the queries
+			prepared on each cursor and the number of cursors checked out
+	"""
+
+	open_databases = get_open_databases()
+
+	while open_databases:
+		close_database(open_databases.pop())
+
+	connection = duckdb.connect(
+		config={
+			"threads": DUCKDB_THREADS,
+			"memory_limit": DUCKDB_MEMORY_LIMIT
+		}
+	)
+	connection.execute(f"ATTACH {to_sql_literal(DB_PATH)} AS {DB_ALIAS} (READ_ONLY)")
+	connection.execute(f"USE {DB_ALIAS}")
+
+	database = {
+		"version": database_version,
+		"connection": connection,
+		"cursors": queue.LifoQueue(),
+		"prepared": {},
+		"checked_out": 0,
+		"closed": False,
+		"lock": threading.Lock()
+	}
+	open_databases.append(database)
+
+	return database
+
+def close_database(database):
+	"""
+	Closes a database opened by get_database along with its idle cursors. Cursors still
+	checked out by a script run are closed when they are returned, and the connection
+	once the last of them is.
+
+	Arguments:
+		database (dict): The database to close, see get_database
+	Returns: N/A
+	"""
+
+	with database["lock"]:
+		database["closed"] = True
+
+		while not database["cursors"].empty():
+			database["cursors"].get_nowait().close()
+
+		if database["checked_out"] == 0:
+			database["connection"].close()
+
+@contextmanager
+def database_cursor():
+	"""
+	Checks out a cursor for the current script run. Cursors are separate connections to
+	the shared database, so concurrent sessions run their queries in parallel instead of
+	sharing a single connection. Nested calls within a script run reuse its cursor, and
+	the cursor is returned to the pool when the outermost call exits.
+
+	Returns:
+		tuple: The database and a cursor on it
+	"""
+
+	if getattr(script_run, "cursor", None) is not None:
+		yield script_run.database, script_run.cursor
+		return
+
+	# Another session may close the database when it opens a newer version
+	while True:
+		database = get_database(get_database_version())
+
+		with database["lock"]:
+			if database["closed"]:
+				continue
+
+			try:
+				cursor = database["cursors"].get_nowait()
+			except queue.Empty:
+				cursor = database["connection"].cursor()
+				cursor.execute(f"USE {DB_ALIAS}")
+				database["prepared"][id(cursor)] = set()
+
+			database["checked_out"] += 1
+			break
+
+	script_run.database, script_run.cursor = database, cursor
+
+	try:
+		yield database, cursor
+	finally:
+		script_run.database, script_run.cursor = None, None
+
+		with database["lock"]:
+			database["checked_out"] -= 1
+
+			if not database["closed"]:
+				database["cursors"].put(cursor)
+			else:
+				cursor.close()
+
+				if database["checked_out"] == 0:
+					database["connection"].close()
+
+def execute_query(database, cursor, name, params):
+	"""
+	Executes a dashboard query as a prepared statement with bound parameters. The query
+	is prepared once per cursor, so it is parsed and planned once rather than on every
+	rerun. Preparing, executing and converting the result to a dataframe are recorded as
+	separate metrics events.
+
+	Arguments:
+		database (dict): The database the cursor belongs to, see get_database
+		cursor (duckdb.DuckDBPyConnection): The cursor to execute the query on
+		name (str): The query name in QUERIES
+		params (dict): The parameter values, keys not used by the query are ignored
+	Returns:
+		pandas.DataFrame: The query result
+	"""
+
+	prepared = database["prepared"][id(cursor)]
+
+	if name not in prepared:
+		start_time = time.perf_counter()
+		cursor.execute(f"PREPARE {name} AS {QUERIES[name]}")
+		metrics.record("prepare", name, time.perf_counter() - start_time)
+		prepared.add(name)
+
+	arguments = ", ".join(f"{key} := {to_sql_literal(params[key])}" for key in sorted(QUERY_PARAMETERS[name]))
+	statement = f"EXECUTE {name}({arguments})" if arguments else f"EXECUTE {name}"
+
+	start_time = time.perf_counter()
+	result = cursor.execute(statement)
+	execute_time = time.perf_counter()
+	df = result.df()
+
+	metrics.record("execute", name, execute_time - start_time)
+	metrics.record("fetch_df", name, time.perf_counter() - execute_time, rows=len(df))
+	script_run.query_executed = True
+
+	return df
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES, show_spinner=False)
+def run_query(name, params, database_version, _database, _cursor):
+	"""
+	Runs a query against the given version of the database and caches the resulting
+	dataframe per combination of query, parameters and database version. The database
+	and cursor are not part of the cache key.
+	"""
+
+	return execute_query(_database, _cursor, name, params)
+
+def query_df(name, params=None):
+	"""
+	Runs a query with the cursor of the current script run, returning a cached result
+	when the same query and parameters were already run against the same version of the
+	database. The query is recorded as a metrics event with its wall time, rows and
+	whether it was a cache hit.
+	"""
+
+	params = {key: value for key, value in (params or {}).items() if key in QUERY_PARAMETERS[name]}
+
+	with metrics.timed("query", name) as event:
+		script_run.query_executed = False
+
+		with database_cursor() as (database, cursor):
+			df = run_query(name, params, database["version"], database, cursor)
+
+		# run_query only calls execute_query when the result is not cached
+		event["rows"] = len(df)
+		event["hits"], event["misses"] = (0, 1) if script_run.query_executed else (1, 0)
+
+	return df
+
+def get_dashboard_data(page_options):
+	"""
+	Returns the filtered monthly sentiment rollups for the page filters. The relation is
+	queried once per rerun and every chart and account leaderboard is computed from it.
+
+	Arguments:
+		page_options (dict): The filters selected in the sidebar
+	Returns:
+		pandas.DataFrame: Sentiment sums and counts per month, party, type and account name
+	"""
+
+	return query_df("dashboard_sentiment", get_query_params(page_options))
+
+def get_monthly_sentiment(df, by=None):
+	"""
+	Aggregates the dashboard data to average sentiment per month.
+
+	Arguments:
+		df (pandas.DataFrame): The dashboard data, see get_dashboard_data
+		by (str): Optional column to additionally group by
+	Returns:
+		pandas.DataFrame: Average sentiment per month ordered by month
+	"""
+
+	columns = ["year_month"] + ([by] if by else [])
+	df = df.groupby(columns, as_index=False)[["sum_sentiment", "count_tweets"]].sum()
+	df["avg_sentiment"] = df["sum_sentiment"] / df["count_tweets"]
+	df = df.sort_values("year_month")
+
+	# Format the month labels only for the aggregated rows
+	df["created_date"] = pd.to_datetime(df["year_month"].astype(str), format="%Y%m").dt.strftime("%b %y")
+
+	return df
+
+def get_account_stats(df):
+	"""
+	Aggregates the dashboard data to sentiment statistics per account name.
+
+	Arguments:
+		df (pandas.DataFrame): The dashboard data, see get_dashboard_data
+	Returns:
+		pandas.DataFrame: Average sentiment and positive/negative counts and percentages
+			per party, account name and type
+	"""
+
+	df = df.groupby(["party", "name", "type"], as_index=False)[["sum_sentiment", "count_tweets", "count_pos", "count_neg"]].sum()
+	df["avg_sentiment"] = df["sum_sentiment"] / df["count_tweets"]
+	df["count_positive"] = df["count_pos"]
+	df["pct_positive"] = df["count_pos"] / df["count_tweets"]
+	df["count_negative"] = df["count_neg"]
+	df["pct_negative"] = df["count_neg"] / df["count_tweets"]
+
+	return df
+
+def show_kpis_combined():
+
+	st.header("Combined Party Sentiment Year-To-Date")
+	st.caption("Data only available through July 2023")
+
+	df = query_df("kpis_combined")
 	
 	df = df.set_index("Year")
 
@@ -69,28 +459,12 @@ def show_kpis_combined():
 	with column_right:
 		column_right.metric("Percentage Negative (YTD)", f"{int(pct_neg_2023)}%", f"{int(pct_neg_change)}%")
 
-def show_average_sentiment_combined(page_options):
+def show_average_sentiment_combined(df_dashboard):
 
 	st.header("Average Sentiment with Parties Combined")
-	
-	begin_date = f"{page_options['begin_year']}-01-01"
-	end_date = f"{page_options['end_year']}-12-31"
-	account_types = "'member'" if page_options["show_members_only"] else "'committee', 'member', 'caucus', 'party'"
 
-	df = con.execute(f"""--sql
-		SELECT
-			STRFTIME(CAST(tweets.created_at AS TIMESTAMP), '%b %y') AS created_date,
-			STRFTIME(CAST(tweets.created_at AS TIMESTAMP), '%Y-%m') AS created_date_order,
-			'C' AS combined,
-			AVG(tweets.sentiment) AS avg_sentiment
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party IN ('D', 'R')
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		GROUP BY created_date, created_date_order, combined
-		ORDER BY created_date_order ASC
-	""").df()
+	df = get_monthly_sentiment(df_dashboard)
+	df["combined"] = "C"
 
 	fig = px.line(
 		df, 
@@ -113,28 +487,11 @@ def show_average_sentiment_combined(page_options):
 
 	st.plotly_chart(fig, theme="streamlit", use_container_width=True)
 		
-def show_average_sentiment_by_party(page_options):
+def show_average_sentiment_by_party(df_dashboard):
 
 	st.header("Average Sentiment by Party")
-	
-	begin_date = f"{page_options['begin_year']}-01-01"
-	end_date = f"{page_options['end_year']}-12-31"
-	account_types = "'member'" if page_options["show_members_only"] else "'committee', 'member', 'caucus', 'party'"
 
-	df = con.execute(f"""--sql
-		SELECT
-			STRFTIME(CAST(tweets.created_at AS TIMESTAMP), '%b %y') AS created_date,
-			STRFTIME(CAST(tweets.created_at AS TIMESTAMP), '%Y-%m') AS created_date_order,
-			party,
-			AVG(sentiment) AS avg_sentiment
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party IN ('D', 'R')
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		GROUP BY created_date, created_date_order, party
-		ORDER BY created_date_order ASC
-	""").df()
+	df = get_monthly_sentiment(df_dashboard, by="party")
 
 	fig = px.line(
 		df, 
@@ -158,30 +515,13 @@ def show_average_sentiment_by_party(page_options):
 
 	st.plotly_chart(fig, theme="streamlit", use_container_width=True)
 
-def show_pies_by_party(page_options):
+def show_pies_by_party(df_dashboard):
 
 	st.header("Sentiment Breakdown by Party")
-	
-	begin_date = f"{page_options['begin_year']}-01-01"
-	end_date = f"{page_options['end_year']}-12-31"
-	account_types = "'member'" if page_options["show_members_only"] else "'committee', 'member', 'caucus', 'party'"
 
-	df = con.execute(f"""--sql
-		SELECT
-			party,
-			CASE 
-				WHEN sentiment >= 0.05 THEN 'positive'
-				WHEN sentiment <= -0.05 THEN 'negative'
-				ELSE 'neutral'
-				END AS 'sentiment_classification',
-			COUNT(*) AS count_tweets
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party IN ('D', 'R')
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		GROUP BY party, sentiment_classification
-	""").df()
+	df = df_dashboard.groupby("party", as_index=False)[["count_pos", "count_neg", "count_neu"]].sum()
+	df = df.rename(columns={"count_pos": "positive", "count_neg": "negative", "count_neu": "neutral"})
+	df = df.melt(id_vars="party", var_name="sentiment_classification", value_name="count_tweets")
 
 	# Show pie charts of sentimaent breakdown
 	left_column, right_column = st.columns(2)
@@ -216,90 +556,82 @@ def show_pies_by_party(page_options):
 		)
 		right_column.plotly_chart(fig_r, theme="streamlit", use_container_width=True)
 
-def format_tweet(url, text="", embed_str=False):
+def format_tweet(url, text="", embed_str=False, embeds=None):
+	"""
+	Shows a tweet embedded from the oEmbed endpoint, or its text when embed_str is set.
+
+	Arguments:
+		url (str): Tweet url
+		text (str): Tweet text shown when embed_str is set
+		embed_str (bool): Whether to show the text instead of the embed
+		embeds (dict): Embed html by url prefetched with embed.fetch_embeds, the tweet is
+			fetched on its own if not given
+	Returns:
+		DeltaGenerator: The embedded tweet, None if its embed could not be retrieved
+	"""
+
 	html = ""
 
 	if not embed_str:
-		try:
-			api = f"https://publish.twitter.com/oembed?url={url}"
-			response = requests.get(api)
-			html = response.json()["html"]
-		except:
+		if embeds is None:
+			embeds = embed.fetch_embeds([url])
+
+		html = embeds.get(url)
+
+		if html is None:
 			return None
 	else:
 		html = f"<blockquote>{text}</blockquote>"
 	
 	return components.html(html, height=700)
 
-def show_positive_accounts_by_party(page_options):
+@st.fragment
+def show_example_tweets(label, query_name, page_options):
+	"""
+	Shows the example tweets of both parties in an expander. The tweets are only queried
+	and embedded once the examples are turned on, and as a fragment, turning them on
+	reruns this panel rather than the whole page.
+
+	Arguments:
+		label (str): The expander label
+		query_name (str): Name of the query returning the example tweets by party
+		page_options (dict): The filters selected in the sidebar
+	"""
+
+	with st.expander(label):
+		if not st.toggle("Show examples", key=f"{query_name}_examples"):
+			st.caption("Turn on to retrieve example tweets from Twitter.")
+			return
+
+		df_tweets = query_df(query_name, get_query_params(page_options))
+
+		# Fetch the embeds of the examples of both parties at once, see embed.fetch_embeds
+		embeds = embed.fetch_embeds(df_tweets["link"])
+
+		column_left_example_tweets, column_right_example_tweets = st.columns(2)
+
+		for column, party in ((column_left_example_tweets, "D"), (column_right_example_tweets, "R")):
+			with column:
+				count_successful_retrievals = 0
+
+				for link in df_tweets.loc[df_tweets["party"] == party, "link"]:
+					if format_tweet(url=link, embeds=embeds):
+						count_successful_retrievals += 1
+
+					if count_successful_retrievals == 5:
+						break
+
+	metrics.write_prometheus()
+
+def show_positive_accounts_by_party(df_dashboard, page_options):
 
 	st.header("Most Positive Accounts by Party")
-	
-	begin_date = f"{page_options['begin_year']}-01-01"
-	end_date = f"{page_options['end_year']}-12-31"
-	account_types = "'member'" if page_options["show_members_only"] else "'committee', 'member', 'caucus', 'party'"
 
-	# Get statistics for positive tweets for Democrat accounts
-	df_d_pos = con.execute(f"""--sql
-		SELECT
-			accounts.name,
-			accounts.type,
-			AVG(sentiment) AS avg_sentiment,
-			SUM(CASE WHEN sentiment >= 0.05 THEN 1 ELSE 0 END) AS count_positive,
-			SUM(CASE WHEN sentiment >= 0.05 THEN 1 ELSE 0 END) / COUNT(*) AS pct_positive
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party ='D'
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		GROUP BY accounts.name, accounts.type
-	""").df()
-
-	# Get statistics for positive tweets for Republican accounts
-	df_r_pos = con.execute(f"""--sql
-		SELECT
-			accounts.name,
-			accounts.type,
-			AVG(sentiment) AS avg_sentiment,
-			SUM(CASE WHEN sentiment >= 0.05 THEN 1 ELSE 0 END) AS count_positive,
-			SUM(CASE WHEN sentiment >= 0.05 THEN 1 ELSE 0 END) / COUNT(*) AS pct_positive
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party ='R'
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		GROUP BY accounts.name, accounts.type
-	""").df()
-
-	# Get most positive tweet examples for Democrat accounts
-	df_d_tweets_pos = con.execute(f"""--sql
-		SELECT DISTINCT
-			tweets.sentiment,
-			tweets.text,
-			tweets.link
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party ='D'
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		ORDER BY tweets.sentiment DESC
-		LIMIT 10
-	""").df()
-
-	# Get most positive tweet examples for Republican accounts
-	df_r_tweets_pos = con.execute(f"""--sql
-		SELECT DISTINCT
-			tweets.sentiment,
-			tweets.text,
-			tweets.link
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party ='R'
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		ORDER BY tweets.sentiment DESC
-		LIMIT 10
-	""").df()
+	# Get account statistics for both parties
+	df_accounts = get_account_stats(df_dashboard)
+
+	df_d_pos = df_accounts.loc[df_accounts["party"] == "D"]
+	df_r_pos = df_accounts.loc[df_accounts["party"] == "R"]
 
 	tab1, tab2, tab3 = st.tabs(["Average Sentiment", "Count Positive Tweets", "Percentage Positive Tweets"])
 
@@ -412,103 +744,17 @@ def show_positive_accounts_by_party(page_options):
 			fig_r_tab3.update_layout(yaxis_autorange="reversed", xaxis_tickformat = "~%")
 			tab3_right_column.plotly_chart(fig_r_tab3, theme="streamlit", use_container_width=True)
 		
-	example_tweets_expander = st.expander("Positive Tweet Examples")
+	show_example_tweets("Positive Tweet Examples", "positive_tweets_by_party", page_options)
 
-	with example_tweets_expander:
-
-		column_left_example_tweets, column_right_example_tweets = st.columns(2)
-
-		with column_left_example_tweets:
-			count_successful_retrievals_d = 0
-
-			for index, row in df_d_tweets_pos.iterrows():
-				tweet_d = format_tweet(url=row["link"], text="text")
-
-				if (tweet_d):
-					count_successful_retrievals_d += 1
-				
-				if count_successful_retrievals_d == 5:
-					break
-		
-		with column_right_example_tweets:
-			count_successful_retrievals_r = 0
-
-			for index, row in df_r_tweets_pos.iterrows():
-				tweet_r = format_tweet(url=row["link"], text="text")
-				
-				if (tweet_r):
-					count_successful_retrievals_r += 1
-				
-				if count_successful_retrievals_r == 5:
-					break
-
-def show_negative_accounts_by_party(page_options):
+def show_negative_accounts_by_party(df_dashboard, page_options):
 
 	st.header("Most Negative Accounts by Party")
-	
-	begin_date = f"{page_options['begin_year']}-01-01"
-	end_date = f"{page_options['end_year']}-12-31"
-	account_types = "'member'" if page_options["show_members_only"] else "'committee', 'member', 'caucus', 'party'"
 
-	df_d_neg = con.execute(f"""--sql
-		SELECT
-			accounts.name,
-			accounts.type,
-			AVG(sentiment) AS avg_sentiment,
-			SUM(CASE WHEN sentiment <= 0.05 THEN 1 ELSE 0 END) AS count_negative,
-			SUM(CASE WHEN sentiment <= 0.05 THEN 1 ELSE 0 END) / COUNT(*) AS pct_negative
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party ='D'
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		GROUP BY accounts.name, accounts.type
-	""").df()
-
-	df_r_neg = con.execute(f"""--sql
-		SELECT
-			accounts.name,
-			accounts.type,
-			AVG(sentiment) AS avg_sentiment,
-			SUM(CASE WHEN sentiment <= 0.05 THEN 1 ELSE 0 END) AS count_negative,
-			SUM(CASE WHEN sentiment <= 0.05 THEN 1 ELSE 0 END) / COUNT(*) AS pct_negative
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party ='R'
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		GROUP BY accounts.name, accounts.type
-	""").df()
-
-	# Get most negative tweet examples for Democrat accounts
-	df_d_tweets_neg = con.execute(f"""--sql
-		SELECT DISTINCT
-			tweets.sentiment,
-			tweets.text,
-			tweets.link
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party ='D'
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		ORDER BY tweets.sentiment ASC
-		LIMIT 10
-	""").df()
-
-	# Get most negative tweet examples for Republican accounts
-	df_r_tweets_neg = con.execute(f"""--sql
-		SELECT DISTINCT
-			tweets.sentiment,
-			tweets.text,
-			tweets.link
-		FROM tweets
-			JOIN accounts ON accounts.id = tweets.account_id
-		WHERE accounts.party ='R'
-			AND tweets.created_at BETWEEN \'{begin_date}\' AND \'{end_date}\'
-			AND accounts.type IN ({account_types})
-		ORDER BY tweets.sentiment ASC
-		LIMIT 10
-	""").df()
+	# Get account statistics for both parties
+	df_accounts = get_account_stats(df_dashboard)
+
+	df_d_neg = df_accounts.loc[df_accounts["party"] == "D"]
+	df_r_neg = df_accounts.loc[df_accounts["party"] == "R"]
 
 	tab1, tab2, tab3 = st.tabs(["Average Sentiment", "Count Negative Tweets", "Percentage Negative Tweets"])
 
@@ -621,35 +867,7 @@ def show_negative_accounts_by_party(page_options):
 			fig_r_tab3.update_layout(yaxis_autorange="reversed", xaxis_tickformat = "~%")
 			tab3_right_column.plotly_chart(fig_r_tab3, theme="streamlit", use_container_width=True)
 
-	example_tweets_expander_neg = st.expander("Negative Tweet Examples")
-
-	with example_tweets_expander_neg:
-
-		column_left_example_tweets, column_right_example_tweets = st.columns(2)
-
-		with column_left_example_tweets:
-			count_successful_retrievals_d = 0
-
-			for index, row in df_d_tweets_neg.iterrows():
-				tweet_d = format_tweet(url=row["link"], text="text")
-
-				if (tweet_d):
-					count_successful_retrievals_d += 1
-				
-				if count_successful_retrievals_d == 5:
-					break
-		
-		with column_right_example_tweets:
-			count_successful_retrievals_r = 0
-
-			for index, row in df_r_tweets_neg.iterrows():
-				tweet_r = format_tweet(url=row["link"], text="text")
-				
-				if (tweet_r):
-					count_successful_retrievals_r += 1
-				
-				if count_successful_retrievals_r == 5:
-					break
+	show_example_tweets("Negative Tweet Examples", "negative_tweets_by_party", page_options)
 
 
 def main():
@@ -704,15 +922,44 @@ def main():
 		""")
 		read_more_expander.write("\n")
 
-	# Display combined data sections
-	show_kpis_combined()
-	show_average_sentiment_combined(page_options)
+	# Run all section queries of this script run on one cursor
+	with database_cursor():
+		metrics.begin_run()
+
+		with metrics.timed("section", "dashboard_data"):
+			df_dashboard = get_dashboard_data(page_options)
+
+		# Display combined data sections
+		with metrics.timed("section", "kpis_combined"):
+			show_kpis_combined()
+
+		with metrics.timed("section", "average_sentiment_combined"):
+			show_average_sentiment_combined(df_dashboard)
+
+		# Display party split data sections
+		with metrics.timed("section", "average_sentiment_by_party"):
+			show_average_sentiment_by_party(df_dashboard)
+
+		with metrics.timed("section", "pies_by_party"):
+			show_pies_by_party(df_dashboard)
+
+		with metrics.timed("section", "positive_accounts_by_party"):
+			show_positive_accounts_by_party(df_dashboard, page_options)
+
+		with metrics.timed("section", "negative_accounts_by_party"):
+			show_negative_accounts_by_party(df_dashboard, page_options)
+
+	# Wall time, rows and cache hits of the queries, sections and embed fetches of this run
+	with st.sidebar.expander("Debug timings"):
+		st.dataframe(
+			pd.DataFrame(
+				metrics.get_run_events(),
+				columns=["kind", "name", "seconds", "child_seconds", "rows", "hits", "misses"]
+			),
+			hide_index=True
+		)
 
-	# Display party split data sections
-	show_average_sentiment_by_party(page_options)
-	show_pies_by_party(page_options)
-	show_positive_accounts_by_party(page_options)
-	show_negative_accounts_by_party(page_options)
+	metrics.write_prometheus()
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
@@ -0,0 +1,967 @@
+import os
+import glob
+import json
+import time
+import random
+import string
+import shutil
+import datetime
+import platform
+import logging
+import tempfile
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import duckdb
+import requests
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import app
+import embed
+import process_data
+
+logging.basicConfig(level=logging.INFO, format=f"%(levelname)s: %(message)s\n")
+
+SAMPLE_TWEETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/json/2017-06-21.json.example")
+SAMPLE_ACCOUNTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/json/accounts/accounts.json")
+TWEET_SOURCES = ["Twitter Web Client", "Twitter for iPhone", "TweetDeck", "Media Studio", "Twitter for Android"]
+
+# Queries representative of the dashboard sections that still scan the tweets table
+BENCHMARK_QUERIES = [
+	"""--sql
+		SELECT
+			accounts.party,
+			accounts.name,
+			AVG(tweets.sentiment) AS avg_sentiment,
+			SUM(CASE WHEN tweets.sentiment >= 0.05 THEN 1 ELSE 0 END) AS count_positive
+		FROM tweets
+			JOIN accounts ON accounts.account_key = tweets.account_key
+		WHERE tweets.party IN ('D', 'R')
+		GROUP BY accounts.party, accounts.name
+	""",
+	"""--sql
+		SELECT DISTINCT
+			sentiment,
+			text,
+			link
+		FROM tweets
+		WHERE party = 'D'
+		ORDER BY sentiment DESC
+		LIMIT 10
+	""",
+	"""--sql
+		SELECT
+			year_month,
+			party,
+			SUM(sum_sentiment) / SUM(count_tweets) AS avg_sentiment
+		FROM monthly_sentiment
+		WHERE party IN ('D', 'R')
+		GROUP BY year_month, party
+	"""
+]
+
+def run_sessions(count_sessions, run_session):
+	"""
+	Runs the given session function on count_sessions threads at the same time.
+
+	Arguments:
+		count_sessions (int): Number of concurrent sessions
+		run_session (function): Function run by each session
+	Returns:
+		float: Wall time until all sessions finished, in seconds
+	"""
+
+	threads = [threading.Thread(target=run_session) for _ in range(count_sessions)]
+	start_time = time.perf_counter()
+
+	for thread in threads:
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	return time.perf_counter() - start_time
+
+def benchmark_concurrency(sessions=(1, 2, 4, 8), repeats=3):
+	"""
+	Compares dashboard query throughput under concurrent sessions when all sessions share
+	a single connection, as app.py used to, against a cursor per script run from
+	app.database_cursor.
+
+	Arguments:
+		sessions (list): Numbers of concurrent sessions to benchmark
+		repeats (int): Number of times each session runs the benchmark queries
+	Returns:
+		list: One result per number of sessions with the throughput of both approaches
+	"""
+
+	logging.info("Benchmarking concurrent sessions...")
+
+	results = []
+	shared_connection = duckdb.connect(
+		database=app.DB_PATH,
+		read_only=True,
+		config={
+			"threads": app.DUCKDB_THREADS,
+			"memory_limit": app.DUCKDB_MEMORY_LIMIT
+		}
+	)
+	shared_lock = threading.Lock()
+
+	def run_shared_session():
+		for _ in range(repeats):
+			for query in BENCHMARK_QUERIES:
+				# A single connection must not be used by several threads at once
+				with shared_lock:
+					shared_connection.execute(query).df()
+
+	def run_cursor_session():
+		with app.database_cursor() as (database, cursor):
+			for _ in range(repeats):
+				for query in BENCHMARK_QUERIES:
+					cursor.execute(query).df()
+
+	# Warm up both approaches so the first measurement does not pay for cold caches
+	run_sessions(1, run_shared_session)
+	run_sessions(1, run_cursor_session)
+
+	for count_sessions in sessions:
+		count_queries = count_sessions * repeats * len(BENCHMARK_QUERIES)
+		elapsed_shared = run_sessions(count_sessions, run_shared_session)
+		elapsed_cursors = run_sessions(count_sessions, run_cursor_session)
+
+		result = {
+			"sessions": count_sessions,
+			"shared_queries_per_sec": count_queries / elapsed_shared,
+			"cursor_queries_per_sec": count_queries / elapsed_cursors
+		}
+		results.append(result)
+
+		logging.info(f"{count_sessions} sessions: shared connection {result['shared_queries_per_sec']:.1f} queries/sec, cursor per run {result['cursor_queries_per_sec']:.1f} queries/sec")
+
+	shared_connection.close()
+
+	logging.info("Done.")
+
+	return results
+
+def write_swap_database(path, count_tweets):
+	"""
+	Writes a database with a tweets table of count_tweets rows and swaps it in at path,
+	the way load_duckdb moves its staging database into place.
+
+	Arguments:
+		path (str): Path of the database
+		count_tweets (int): Number of tweets
+	Returns: N/A
+	"""
+
+	con = duckdb.connect(f"{path}.staging")
+	con.execute(f"CREATE TABLE tweets AS SELECT range AS id FROM range({int(count_tweets)})")
+	con.close()
+
+	os.replace(f"{path}.staging", path)
+
+def check_database_swap(count_tweets=6000, count_swapped=1500):
+	"""
+	Checks that the dashboard reads a database swapped in by load_duckdb, while a script
+	run still holds a cursor on the previous version. The previous version must keep its
+	rows for that script run, and be closed once its cursor is returned.
+
+	Arguments:
+		count_tweets (int): Number of tweets of the first version
+		count_swapped (int): Number of tweets of the swapped in version
+	Returns:
+		dict: The tweets counted on each version and whether the check passed
+	"""
+
+	logging.info("Checking database swap...")
+
+	working_directory = os.getcwd()
+	checked_out = threading.Event()
+	swapped = threading.Event()
+	counts = {}
+
+	def run_previous_session():
+		with app.database_cursor() as (database, cursor):
+			counts["before"] = cursor.execute("SELECT COUNT(*) FROM tweets").fetchone()[0]
+			checked_out.set()
+			swapped.wait()
+			counts["previous_during_swap"] = cursor.execute("SELECT COUNT(*) FROM tweets").fetchone()[0]
+
+		counts["previous_closed"] = database["closed"] and database["checked_out"] == 0
+
+	with tempfile.TemporaryDirectory() as directory:
+
+		# app uses paths relative to the repository root
+		os.chdir(directory)
+
+		try:
+			os.makedirs("data")
+			write_swap_database(app.DB_PATH, count_tweets)
+
+			thread = threading.Thread(target=run_previous_session)
+			thread.start()
+			checked_out.wait()
+
+			write_swap_database(app.DB_PATH, count_swapped)
+
+			with app.database_cursor() as (database, cursor):
+				counts["after"] = cursor.execute("SELECT COUNT(*) FROM tweets").fetchone()[0]
+
+			swapped.set()
+			thread.join()
+
+			for database in app.get_open_databases():
+				app.close_database(database)
+		finally:
+			os.chdir(working_directory)
+
+	result = {
+		**counts,
+		"passed": counts == {
+			"before": count_tweets,
+			"previous_during_swap": count_tweets,
+			"after": count_swapped,
+			"previous_closed": True
+		}
+	}
+
+	logging.info(f"Before swap {counts['before']} tweets, after swap {counts['after']} tweets, previous version {counts['previous_during_swap']} tweets and closed: {counts['previous_closed']}")
+	logging.info(f"Database swap check {'passed' if result['passed'] else 'FAILED'}")
+	logging.info("Done.")
+
+	return result
+
+def get_row_group_ranges_query(table):
+	"""
+	Returns a query for the created_at min/max zone map of each row group of a tweets
+	table, read from the DuckDB storage statistics.
+
+	Arguments:
+		table (str): The qualified table name
+	Returns:
+		str: A query over the row group ranges with min_created_at and max_created_at
+	"""
+
+	return f"""--sql
+		SELECT
+			row_group_id,
+			MIN(CAST(regexp_extract(stats, 'Min: ([^,\\]]+)', 1) AS TIMESTAMPTZ)) AS min_created_at,
+			MAX(CAST(regexp_extract(stats, 'Max: ([^,\\]]+)', 1) AS TIMESTAMPTZ)) AS max_created_at
+		FROM pragma_storage_info('{table}')
+		WHERE column_name = 'created_at'
+			AND segment_type <> 'VALIDITY'
+		GROUP BY row_group_id
+	"""
+
+def benchmark_zone_maps(begin_year=2022, end_year=2022, row_group_size=122880, repeats=5):
+	"""
+	Compares how many row groups of the tweets table a date range filter can skip when
+	the table is stored in arbitrary order against the (created_at, account_key) order
+	written by load_duckdb. Both layouts are copied from the dashboard database into
+	temporary databases with the given row group size.
+
+	Arguments:
+		begin_year (int): First year of the filtered range
+		end_year (int): Last year of the filtered range
+		row_group_size (int): Number of rows per row group of the copies
+		repeats (int): Number of times the filtered query is timed per layout
+	Returns:
+		list: The total, scanned and skipped row groups and query time per layout
+	"""
+
+	logging.info("Benchmarking tweets table layouts...")
+
+	results = []
+	begin_date = f"{begin_year}-01-01"
+	end_date = f"{end_year}-12-31"
+
+	with tempfile.TemporaryDirectory() as directory:
+		con = duckdb.connect()
+		con.execute(f"ATTACH '{app.DB_PATH}' AS source (READ_ONLY)")
+
+		for layout, order in (("unsorted", "hash(id)"), ("sorted", "created_at, account_key")):
+			con.execute(f"ATTACH '{os.path.join(directory, layout)}.duckdb' AS {layout} (ROW_GROUP_SIZE {int(row_group_size)})")
+			con.execute(f"CREATE TABLE {layout}.tweets AS SELECT * FROM source.tweets ORDER BY {order}")
+			con.execute(f"CHECKPOINT {layout}")
+
+			count_row_groups, count_scanned = con.execute(f"""--sql
+				SELECT
+					COUNT(*),
+					COUNT(*) FILTER (WHERE max_created_at >= $begin_date AND min_created_at <= $end_date)
+				FROM ({get_row_group_ranges_query(f"{layout}.tweets")})
+			""", {"begin_date": begin_date, "end_date": end_date}).fetchone()
+
+			start_time = time.perf_counter()
+
+			for _ in range(repeats):
+				con.execute(f"""--sql
+					SELECT AVG(sentiment)
+					FROM {layout}.tweets
+					WHERE created_at BETWEEN $begin_date AND $end_date
+				""", {"begin_date": begin_date, "end_date": end_date}).fetchall()
+
+			result = {
+				"layout": layout,
+				"row_groups": count_row_groups,
+				"row_groups_scanned": count_scanned,
+				"row_groups_skipped": count_row_groups - count_scanned,
+				"query_seconds": (time.perf_counter() - start_time) / repeats
+			}
+			results.append(result)
+
+			logging.info(f"{layout}: {result['row_groups_skipped']} of {count_row_groups} row groups skipped for {begin_year}-{end_year}, query {result['query_seconds'] * 1000:.1f} ms")
+
+		con.close()
+
+	logging.info("Done.")
+
+	return results
+
+def get_accounts_legacy(path):
+	"""
+	Returns the accounts of the accounts json file as process_json_accounts_data built
+	them before it was vectorized, one pandas row and one python loop per owner.
+
+	Arguments:
+		path (str): Path to the accounts json file
+	Returns:
+		pyarrow.Table: The accounts with the accounts parquet schema
+	"""
+
+	with open(path, "r", encoding="utf8") as fin:
+		accounts = []
+
+		users = json.load(fin)
+		df = pd.DataFrame(users)
+		df = df.replace({np.nan: None})
+		df = df.replace({"N/A": None})
+
+		for index, row in df.iterrows():
+			for account in row["accounts"]:
+				accounts.append({
+					"id": account["id"],
+					"screen_name": account["screen_name"],
+					"account_type": account["account_type"],
+					"name": row["name"],
+					"chamber": row["chamber"],
+					"type": row["type"],
+					"party": row["party"],
+					"state": row["state"]
+				})
+
+	return pa.Table.from_pandas(pd.DataFrame(accounts), preserve_index=False).cast(process_data.ACCOUNTS_SCHEMA)
+
+def benchmark_accounts(scales=(1, 10, 100)):
+	"""
+	Checks that process_json_accounts_data writes the same accounts as the legacy iterrows
+	implementation, and compares their run time on the accounts json file repeated scale
+	times to show how both grow with the number of accounts.
+
+	Arguments:
+		scales (list): Numbers of copies of the accounts json file to benchmark
+	Returns:
+		list: One result per scale with the row count, run times and whether outputs match
+	"""
+
+	logging.info("Benchmarking accounts processing...")
+
+	results = []
+
+	with open(process_data.ACCOUNTS_JSON_PATH, "r", encoding="utf8") as fin:
+		users = json.load(fin)
+
+	with tempfile.TemporaryDirectory() as directory:
+		for scale in scales:
+			path = os.path.join(directory, f"accounts_{scale}.json")
+			output_path = os.path.join(directory, f"accounts_{scale}.parquet")
+
+			with open(path, "w", encoding="utf8") as fout:
+				json.dump(users * scale, fout)
+
+			start_time = time.perf_counter()
+			legacy_table = get_accounts_legacy(path)
+			legacy_seconds = time.perf_counter() - start_time
+
+			start_time = time.perf_counter()
+			process_data.process_json_accounts_data(path, output_path)
+			vectorized_seconds = time.perf_counter() - start_time
+
+			result = {
+				"scale": scale,
+				"accounts": legacy_table.num_rows,
+				"legacy_seconds": legacy_seconds,
+				"vectorized_seconds": vectorized_seconds,
+				"matches": pq.read_table(output_path).equals(legacy_table)
+			}
+			results.append(result)
+
+			logging.info(f"x{scale}: {result['accounts']} accounts, legacy {legacy_seconds:.2f} s, vectorized {vectorized_seconds:.2f} s, outputs match: {result['matches']}")
+
+	logging.info("Done.")
+
+	return results
+
+def measure_json_file_memory(path, batch_size):
+	"""
+	Processes a json tweets file with process_data.process_json_file and measures the
+	peak RSS of the current process before and after. Meant to run in a fresh process,
+	whose peak is not raised by earlier work.
+
+	Arguments:
+		path (str): Path to the json tweets file
+		batch_size (int): Maximum number of tweets held in memory at a time
+	Returns:
+		tuple: The peak RSS before and after processing the file, in megabytes
+	"""
+
+	# Load the analyzer and open the sentiment cache first so they count as baseline
+	process_data.init_sentiment_worker()
+	process_data.get_sentiment_cache()
+	baseline_mb = process_data.get_peak_memory_mb()
+
+	process_data.process_json_file(path, batch_size)
+
+	return baseline_mb, process_data.get_peak_memory_mb()
+
+def benchmark_memory(scales=(1, 10, 40), batch_sizes=(1000, 10000)):
+	"""
+	Measures the peak memory of scoring a json tweets file made of scale copies of the
+	sample day, for each batch size. Every file is processed in a fresh process with an
+	empty sentiment cache, so the peak belongs to that file alone. Streaming keeps the
+	increase over the baseline bounded by the batch size rather than the file size.
+
+	Arguments:
+		scales (list): Numbers of copies of the sample day per file
+		batch_sizes (list): Batch sizes of process_json_file to measure
+	Returns:
+		list: The file size, batch size, baseline and peak RSS of each run
+	"""
+
+	logging.info("Benchmarking tweets processing memory...")
+
+	results = []
+	working_directory = os.getcwd()
+
+	with open(SAMPLE_TWEETS_PATH, "r", encoding="utf8") as fin:
+		tweets = json.load(fin)
+
+	with tempfile.TemporaryDirectory() as directory:
+
+		# process_data uses paths relative to the repository root
+		os.chdir(directory)
+
+		try:
+			os.makedirs("data/json")
+			os.makedirs("data/parquet")
+
+			for scale in scales:
+				path = f"./data/json/sample_x{scale}.json"
+
+				with open(path, "w", encoding="utf8") as fout:
+					json.dump(tweets * scale, fout)
+
+				for batch_size in batch_sizes:
+					if os.path.exists(process_data.SENTIMENT_CACHE_PATH):
+						os.remove(process_data.SENTIMENT_CACHE_PATH)
+
+					with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+						baseline_mb, peak_mb = executor.submit(measure_json_file_memory, path, batch_size).result()
+
+					result = {
+						"scale": scale,
+						"tweets": len(tweets) * scale,
+						"file_mb": os.path.getsize(path) / (1 << 20),
+						"batch_size": batch_size,
+						"baseline_mb": baseline_mb,
+						"peak_mb": peak_mb,
+						"increase_mb": peak_mb - baseline_mb
+					}
+					results.append(result)
+
+					logging.info(f"x{scale} ({result['file_mb']:.0f} MB), batch size {batch_size}: peak RSS {peak_mb:.0f} MB, +{result['increase_mb']:.0f} MB over baseline")
+		finally:
+			os.chdir(working_directory)
+
+	logging.info("Done.")
+
+	return results
+
+def start_oembed_stub(delay=0.2, hang_seconds=30):
+	"""
+	Starts a local oEmbed endpoint on a background thread. It answers every request after
+	delay seconds, except for tweet urls containing "fail", which get a 404, and urls
+	containing "hang", which get no answer for hang_seconds.
+
+	Arguments:
+		delay (float): Response time of the endpoint, in seconds
+		hang_seconds (float): Time hanging requests are held, in seconds
+	Returns:
+		tuple: The server and the url of its oEmbed endpoint
+	"""
+
+	class OEmbedStubHandler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			url = parse_qs(urlparse(self.path).query).get("url", [""])[0]
+
+			if "hang" in url:
+				time.sleep(hang_seconds)
+
+			time.sleep(delay)
+
+			if "fail" in url:
+				self.send_error(404)
+				return
+
+			body = json.dumps({"html": f"<blockquote>{url}</blockquote>"}).encode("utf8")
+
+			self.send_response(200)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			pass
+
+	server = ThreadingHTTPServer(("127.0.0.1", 0), OEmbedStubHandler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+
+	return server, f"http://127.0.0.1:{server.server_port}/oembed"
+
+def benchmark_embeds(count_tweets=40, delay=0.2):
+	"""
+	Compares fetching the embeds of the example tweets one by one with requests.get, as
+	app.py used to, against embed.fetch_embeds on a cold and a warm cache. Tweets are
+	served by a local stub endpoint, one in ten fails and one in twenty never answers
+	within the timeouts.
+
+	Arguments:
+		count_tweets (int): Number of example tweets
+		delay (float): Response time of the stub endpoint, in seconds
+	Returns:
+		list: The wall time and number of embeds retrieved per approach
+	"""
+
+	logging.info("Benchmarking tweet embeds...")
+
+	results = []
+	server, endpoint = start_oembed_stub(delay)
+	urls = [
+		f"https://twitter.com/user/status/{i}{'hang' if i % 20 == 19 else 'fail' if i % 10 == 9 else ''}"
+		for i in range(count_tweets)
+	]
+
+	def fetch_sequential():
+		embeds = {}
+
+		for url in urls:
+			try:
+				response = requests.get(endpoint, params={"url": url}, timeout=(embed.EMBED_CONNECT_TIMEOUT, embed.EMBED_READ_TIMEOUT))
+				embeds[url] = response.json()["html"]
+			except (requests.RequestException, ValueError, KeyError):
+				embeds[url] = None
+
+		return embeds
+
+	with tempfile.TemporaryDirectory() as directory:
+		cache_path = os.path.join(directory, "embed_cache.sqlite")
+
+		for approach, fetch in (
+			("sequential", fetch_sequential),
+			("parallel_cold", lambda: embed.fetch_embeds(urls, endpoint, cache_path)),
+			("parallel_warm", lambda: embed.fetch_embeds(urls, endpoint, cache_path))
+		):
+			start_time = time.perf_counter()
+			embeds = fetch()
+
+			result = {
+				"approach": approach,
+				"seconds": time.perf_counter() - start_time,
+				"embeds": sum(html is not None for html in embeds.values())
+			}
+			results.append(result)
+
+			logging.info(f"{approach}: {result['embeds']} of {count_tweets} embeds in {result['seconds']:.2f} s")
+
+	server.shutdown()
+
+	logging.info("Done.")
+
+	return results
+
+def get_corpus_text(rng, texts, vocabulary, index):
+	"""
+	Returns a tweet text for generate_corpus: a random sample text with a quarter of its
+	words replaced by random words of the sample texts, followed by a t.co style link
+	encoding index, which makes the text unique.
+
+	Arguments:
+		rng (random.Random): The random generator of the corpus
+		texts (list): The words of each sample text
+		vocabulary (list): The words of all sample texts
+		index (int): Index of the tweet in the corpus
+	Returns:
+		str: The tweet text
+	"""
+
+	words = list(rng.choice(texts))
+
+	for i in rng.sample(range(len(words)), len(words) // 4):
+		words[i] = rng.choice(vocabulary)
+
+	token = ""
+
+	for _ in range(10):
+		index, digit = divmod(index, 62)
+		token += (string.digits + string.ascii_letters)[digit]
+
+	return " ".join(words + [f"https://t.co/{token}"])
+
+def generate_corpus(directory, begin_date="2017-06-21", days=1, tweets_per_day=3000, seed=0):
+	"""
+	Writes a synthetic corpus in the layout of the congresstweets dataset to the data
+	directory of the given directory: one json file of tweets per day and the accounts
+	file, next to the empty parquet directory the pipeline writes to. Tweets are posted by
+	the real accounts of accounts.json, so the party and account type mix matches the
+	dashboard, with times spread over the day.
+
+	Each text is a tweet of the sample day with a quarter of its words replaced by words
+	of other tweets, ending with a link unique to the tweet. Every text is new to the
+	sentiment cache, so the tweets stage scores the whole corpus as it would real tweets.
+
+	Arguments:
+		directory (str): Directory the data directory is created in
+		begin_date (str): First day of the corpus, formatted as YYYY-MM-DD
+		days (int): Number of days of tweets
+		tweets_per_day (int): Number of tweets per day
+		seed (int): Seed of the random generator
+	Returns:
+		int: Number of tweets written
+	"""
+
+	logging.info(f"Generating {days} days of {tweets_per_day} tweets...")
+
+	rng = random.Random(seed)
+	json_directory = os.path.join(directory, "data/json")
+	os.makedirs(os.path.join(json_directory, "accounts"), exist_ok=True)
+	os.makedirs(os.path.join(directory, "data/parquet"), exist_ok=True)
+	shutil.copyfile(SAMPLE_ACCOUNTS_PATH, os.path.join(json_directory, "accounts/accounts.json"))
+
+	with open(SAMPLE_ACCOUNTS_PATH, "r", encoding="utf8") as fin:
+		accounts = [account for user in json.load(fin) for account in user["accounts"]]
+
+	with open(SAMPLE_TWEETS_PATH, "r", encoding="utf8") as fin:
+		texts = [tweet["text"].split() for tweet in json.load(fin)]
+
+	vocabulary = [word for words in texts for word in words]
+
+	first_day = datetime.date.fromisoformat(begin_date)
+	timezone = datetime.timezone(datetime.timedelta(hours=-4))
+	count_tweets = 0
+
+	for day in range(days):
+		date = first_day + datetime.timedelta(days=day)
+		tweets = []
+
+		for second in sorted(rng.randrange(24 * 60 * 60) for _ in range(tweets_per_day)):
+			account = rng.choice(accounts)
+			tweet_id = str(800000000000000000 + count_tweets)
+			count_tweets += 1
+
+			tweets.append({
+				"id": tweet_id,
+				"screen_name": account["screen_name"],
+				"time": (datetime.datetime(date.year, date.month, date.day, tzinfo=timezone) + datetime.timedelta(seconds=second)).isoformat(),
+				"link": f"https://www.twitter.com/{account['screen_name']}/statuses/{tweet_id}",
+				"text": get_corpus_text(rng, texts, vocabulary, count_tweets),
+				"source": rng.choice(TWEET_SOURCES),
+				"user_id": account["id"]
+			})
+
+		with open(os.path.join(json_directory, f"{date.isoformat()}.json"), "w", encoding="utf8") as fout:
+			json.dump(tweets, fout)
+
+	logging.info("Done.")
+
+	return count_tweets
+
+def time_stage(stage, function, *args, **kwargs):
+	"""
+	Runs a pipeline stage and returns its wall time.
+
+	Arguments:
+		stage (str): The stage name
+		function (function): The stage function
+	Returns:
+		float: Wall time of the stage, in seconds
+	"""
+
+	start_time = time.perf_counter()
+	function(*args, **kwargs)
+	elapsed = time.perf_counter() - start_time
+
+	logging.info(f"Stage {stage}: {elapsed:.2f} s")
+
+	return elapsed
+
+def benchmark_queries(repeats=5):
+	"""
+	Times every dashboard query of app.QUERIES against app.DB_PATH for each combination
+	of the page filters. The first run of each query is reported separately from the
+	median of the repeated runs.
+
+	Arguments:
+		repeats (int): Number of timed runs per query and filters
+	Returns:
+		list: The filters, row count, first run time and median run time of each query
+	"""
+
+	results = []
+	con = duckdb.connect(app.DB_PATH, read_only=True)
+
+	years = [year for year, in con.execute("SELECT DISTINCT year_month // 100 FROM monthly_sentiment ORDER BY 1").fetchall()]
+
+	# The full range and the last year, with and without the members only filter
+	page_options = [
+		{"begin_year": begin_year, "end_year": years[-1], "show_members_only": show_members_only}
+		for begin_year in sorted({years[0], years[-1]})
+		for show_members_only in (False, True)
+	]
+
+	for name, query in app.QUERIES.items():
+
+		# Queries without parameters return the same rows for every filter
+		for options in (page_options if app.QUERY_PARAMETERS[name] else page_options[:1]):
+			params = {key: value for key, value in app.get_query_params(options).items() if key in app.QUERY_PARAMETERS[name]}
+			timings = []
+
+			for _ in range(repeats + 1):
+				start_time = time.perf_counter()
+				count_rows = len(con.execute(query, params).fetchall())
+				timings.append(time.perf_counter() - start_time)
+
+			result = {
+				"query": name,
+				**options,
+				"rows": count_rows,
+				"first_seconds": timings[0],
+				"median_seconds": float(np.median(timings[1:]))
+			}
+			results.append(result)
+
+			logging.info(f"Query {name} {options['begin_year']}-{options['end_year']}{' members' if options['show_members_only'] else ''}: {count_rows} rows, first {timings[0] * 1000:.1f} ms, median {result['median_seconds'] * 1000:.1f} ms")
+
+	con.close()
+
+	return results
+
+def benchmark_pipeline(begin_date="2017-06-21", days=1, tweets_per_day=3000, workers=None, repeats=5, output_path="./data/benchmark_results.json", directory=None):
+	"""
+	Generates a synthetic corpus, runs every process_data.py stage on it and times each
+	stage and every dashboard query. The pipeline runs in a temporary directory, or in the
+	given directory when one is given so the generated data can be inspected. Results are
+	written to output_path as json so runs can be compared.
+
+	Arguments:
+		begin_date (str): First day of the corpus, formatted as YYYY-MM-DD
+		days (int): Number of days of tweets
+		tweets_per_day (int): Number of tweets per day
+		workers (int): Number of worker processes scoring tweets
+		repeats (int): Number of timed runs per query and filters
+		output_path (str): Path of the json results file
+		directory (str): Directory to run the pipeline in, a temporary one if None
+	Returns:
+		dict: The benchmark configuration and results
+	"""
+
+	logging.info("Benchmarking pipeline...")
+
+	output_path = os.path.abspath(output_path)
+	working_directory = os.getcwd()
+	temporary_directory = tempfile.TemporaryDirectory() if directory is None else None
+	directory = directory or temporary_directory.name
+
+	os.makedirs(directory, exist_ok=True)
+
+	try:
+		count_tweets = generate_corpus(directory, begin_date, days, tweets_per_day)
+
+		# process_data and app use paths relative to the repository root
+		os.chdir(directory)
+
+		# Score the corpus with an empty sentiment cache when reusing a directory
+		if os.path.exists(process_data.SENTIMENT_CACHE_PATH):
+			os.remove(process_data.SENTIMENT_CACHE_PATH)
+
+		stages = {
+			"process_json_tweets_data": time_stage("process_json_tweets_data", process_data.process_json_tweets_data, workers, True),
+			"process_json_accounts_data": time_stage("process_json_accounts_data", process_data.process_json_accounts_data),
+			"aggregate_parquet_data": time_stage("aggregate_parquet_data", process_data.aggregate_parquet_data, force=True),
+			"load_duckdb": time_stage("load_duckdb", process_data.load_duckdb, force=True)
+		}
+
+		results = {
+			"config": {
+				"begin_date": begin_date,
+				"days": days,
+				"tweets_per_day": tweets_per_day,
+				"workers": workers or os.cpu_count(),
+				"repeats": repeats
+			},
+			"environment": {
+				"created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+				"python": platform.python_version(),
+				"duckdb": duckdb.__version__,
+				"pyarrow": pa.__version__,
+				"cpu_count": os.cpu_count()
+			},
+			"tweets": count_tweets,
+			"stages": stages,
+			"queries": benchmark_queries(repeats)
+		}
+	finally:
+		os.chdir(working_directory)
+
+		if temporary_directory is not None:
+			temporary_directory.cleanup()
+
+	os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+	with open(output_path, "w", encoding="utf8") as fout:
+		json.dump(results, fout, indent=4)
+
+	logging.info(f"Wrote results to {output_path}")
+	logging.info("Done.")
+
+	return results
+
+def benchmark_sentiment(limit=100000, repeats=3):
+	"""
+	Checks that process_data.score_compound_fast gives the same compound scores as the
+	reference vaderSentiment analyzer on the tweets of the json files in ./data/json, or
+	the sample day of tweets if there are none, and compares their throughput.
+
+	Arguments:
+		limit (int): Maximum number of tweet texts to score
+		repeats (int): Number of times the texts are scored per backend
+	Returns:
+		dict: The number of texts and mismatches, the largest difference and the
+			throughput of both backends
+	"""
+
+	logging.info("Benchmarking sentiment scoring...")
+
+	texts = []
+
+	for path in sorted(glob.glob("./data/json/*.json")) or [SAMPLE_TWEETS_PATH]:
+		with open(path, "r", encoding="utf8") as fin:
+			texts.extend(tweet["text"] for tweet in json.load(fin) if isinstance(tweet.get("text"), str))
+
+		if len(texts) >= limit:
+			break
+
+	texts = texts[:limit]
+	analyzer = process_data.SentimentIntensityAnalyzer()
+	scorer = process_data.build_fast_scorer(analyzer)
+
+	reference_scores = [analyzer.polarity_scores(text)["compound"] for text in texts]
+	fast_scores = [process_data.score_compound_fast(text, scorer) for text in texts]
+	differences = [abs(reference - fast) for reference, fast in zip(reference_scores, fast_scores)]
+
+	result = {
+		"texts": len(texts),
+		"mismatches": sum(difference > 0 for difference in differences),
+		"max_difference": max(differences, default=0.0)
+	}
+
+	for backend, score in (
+		("reference", lambda text: analyzer.polarity_scores(text)["compound"]),
+		("fast", lambda text: process_data.score_compound_fast(text, scorer))
+	):
+		start_time = time.perf_counter()
+
+		for _ in range(repeats):
+			for text in texts:
+				score(text)
+
+		result[f"{backend}_texts_per_sec"] = len(texts) * repeats / (time.perf_counter() - start_time)
+
+	logging.info(f"{result['texts']} texts, {result['mismatches']} mismatches, max difference {result['max_difference']}")
+	logging.info(f"Reference {result['reference_texts_per_sec']:.0f} texts/sec, fast {result['fast_texts_per_sec']:.0f} texts/sec ({result['fast_texts_per_sec'] / result['reference_texts_per_sec']:.1f}x)")
+	logging.info("Done.")
+
+	return result
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="Benchmarks for the congress tweets pipeline and dashboard.")
+	subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+	parser_concurrency = subparsers.add_parser("concurrency", help="Dashboard query throughput under concurrent sessions")
+	parser_concurrency.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8])
+	parser_concurrency.add_argument("--repeats", type=int, default=3)
+
+	parser_swap = subparsers.add_parser("swap", help="Check that the dashboard reads a database swapped in while the previous version is in use")
+	parser_swap.add_argument("--tweets", type=int, default=6000)
+	parser_swap.add_argument("--swapped-tweets", type=int, default=1500)
+
+	parser_zone_maps = subparsers.add_parser("zone-maps", help="Row groups skipped by a date range filter per tweets table layout")
+	parser_zone_maps.add_argument("--begin-year", type=int, default=2022)
+	parser_zone_maps.add_argument("--end-year", type=int, default=2022)
+	parser_zone_maps.add_argument("--row-group-size", type=int, default=122880)
+
+	parser_accounts = subparsers.add_parser("accounts", help="Accounts processing parity and run time against the legacy implementation")
+	parser_accounts.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+
+	parser_memory = subparsers.add_parser("memory", help="Peak memory of scoring a json tweets file per file size and batch size")
+	parser_memory.add_argument("--scales", type=int, nargs="+", default=[1, 10, 40])
+	parser_memory.add_argument("--batch-sizes", type=int, nargs="+", default=[1000, 10000])
+
+	parser_embeds = subparsers.add_parser("embeds", help="Example tweet embeds against a local oEmbed stub endpoint")
+	parser_embeds.add_argument("--tweets", type=int, default=40)
+	parser_embeds.add_argument("--delay", type=float, default=0.2)
+
+	parser_pipeline = subparsers.add_parser("pipeline", help="Pipeline stages and dashboard queries on a synthetic corpus")
+	parser_pipeline.add_argument("--begin-date", default="2017-06-21")
+	parser_pipeline.add_argument("--days", type=int, default=1, help="Number of days of tweets, 2200 for six years")
+	parser_pipeline.add_argument("--tweets-per-day", type=int, default=3000)
+	parser_pipeline.add_argument("--workers", type=int, default=None)
+	parser_pipeline.add_argument("--repeats", type=int, default=5)
+	parser_pipeline.add_argument("--output", default="./data/benchmark_results.json")
+	parser_pipeline.add_argument("--directory", default=None, help="Directory to run the pipeline in, a temporary one by default")
+
+	parser_sentiment = subparsers.add_parser("sentiment", help="Parity and throughput of the fast sentiment scorer against vaderSentiment")
+	parser_sentiment.add_argument("--limit", type=int, default=100000)
+	parser_sentiment.add_argument("--repeats", type=int, default=3)
+
+	args = parser.parse_args()
+
+	if args.benchmark == "concurrency":
+		benchmark_concurrency(args.sessions, args.repeats)
+	elif args.benchmark == "swap":
+		if not check_database_swap(args.tweets, args.swapped_tweets)["passed"]:
+			parser.exit(1)
+	elif args.benchmark == "zone-maps":
+		benchmark_zone_maps(args.begin_year, args.end_year, args.row_group_size)
+	elif args.benchmark == "accounts":
+		if not all(result["matches"] for result in benchmark_accounts(args.scales)):
+			parser.exit(1)
+	elif args.benchmark == "memory":
+		benchmark_memory(args.scales, args.batch_sizes)
+	elif args.benchmark == "embeds":
+		benchmark_embeds(args.tweets, args.delay)
+	elif args.benchmark == "pipeline":
+		benchmark_pipeline(args.begin_date, args.days, args.tweets_per_day, args.workers, args.repeats, args.output, args.directory)
+	elif args.benchmark == "sentiment":
+		if benchmark_sentiment(args.limit, args.repeats)["mismatches"] > 0:
+			parser.exit(1)
@@ -0,0 +1,211 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+OEMBED_ENDPOINT = os.environ.get("OEMBED_ENDPOINT", "https://publish.twitter.com/oembed")
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "./data/embed_cache.sqlite")
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", 8))
+EMBED_CONNECT_TIMEOUT = 2
+EMBED_READ_TIMEOUT = 3
+EMBED_DEADLINE = 5
+EMBED_TTL = 7 * 24 * 60 * 60
+EMBED_FAILURE_TTL = 60 * 60
+
+# HTTP session and thread pool shared by all sessions of the dashboard, see get_session
+# and get_executor
+_session = None
+_executor = None
+_lock = threading.RLock()
+
+# Fetches still running, by url, so a url is not requested again until its fetch ends
+_pending = {}
+
+def get_session():
+	"""
+	Returns the HTTP session used for oEmbed requests. Connections to the endpoint are
+	pooled and reused by all fetches instead of opening a connection per tweet.
+
+	Returns:
+		requests.Session: The shared session
+	"""
+
+	global _session
+
+	with _lock:
+		if _session is None:
+			_session = requests.Session()
+			_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=EMBED_WORKERS))
+			_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=EMBED_WORKERS))
+
+		return _session
+
+def get_executor():
+	"""
+	Returns the thread pool oEmbed requests run on.
+
+	Returns:
+		ThreadPoolExecutor: The shared thread pool
+	"""
+
+	global _executor
+
+	with _lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+
+		return _executor
+
+def connect_cache(cache_path=EMBED_CACHE_PATH):
+	"""
+	Opens the on-disk embed cache, creating it if needed. Each url maps to the embed html
+	and the time it was fetched, failures are stored with a null html.
+
+	Arguments:
+		cache_path (str): Path to the sqlite cache file
+	Returns:
+		sqlite3.Connection: A connection to the cache
+	"""
+
+	os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+
+	con = sqlite3.connect(cache_path, timeout=10)
+	con.execute("PRAGMA journal_mode=WAL")
+	con.execute("""--sql
+		CREATE TABLE IF NOT EXISTS embeds (
+			url TEXT PRIMARY KEY,
+			html TEXT,
+			fetched_at REAL
+		)
+	""")
+
+	return con
+
+def get_cached_embeds(urls, cache_path=EMBED_CACHE_PATH):
+	"""
+	Looks up the given urls in the embed cache. Successful fetches are valid for
+	EMBED_TTL and failures for EMBED_FAILURE_TTL, expired entries are left out.
+
+	Arguments:
+		urls (list): Tweet urls
+		cache_path (str): Path to the sqlite cache file
+	Returns:
+		dict: The embed html of each cached url, None for cached failures
+	"""
+
+	if not urls:
+		return {}
+
+	now = time.time()
+	con = connect_cache(cache_path)
+
+	rows = con.execute(f"""--sql
+		SELECT url, html
+		FROM embeds
+		WHERE url IN ({", ".join("?" * len(urls))})
+			AND fetched_at > CASE WHEN html IS NULL THEN ? ELSE ? END
+	""", [*urls, now - EMBED_FAILURE_TTL, now - EMBED_TTL]).fetchall()
+
+	con.close()
+
+	return dict(rows)
+
+def fetch_embed(url, endpoint=OEMBED_ENDPOINT, cache_path=EMBED_CACHE_PATH):
+	"""
+	Fetches the embed html of a tweet from the oEmbed endpoint and stores the result in
+	the embed cache, whether the fetch succeeded or not.
+
+	Arguments:
+		url (str): Tweet url
+		endpoint (str): oEmbed endpoint url
+		cache_path (str): Path to the sqlite cache file
+	Returns:
+		str: The embed html, None if the fetch failed
+	"""
+
+	html = None
+
+	try:
+		response = get_session().get(
+			endpoint,
+			params={"url": url},
+			timeout=(EMBED_CONNECT_TIMEOUT, EMBED_READ_TIMEOUT)
+		)
+		response.raise_for_status()
+		html = response.json()["html"]
+	except (requests.RequestException, ValueError, KeyError) as e:
+		logging.debug(f"Failed to fetch embed for {url}: {e}")
+
+	con = connect_cache(cache_path)
+
+	with con:
+		con.execute("INSERT OR REPLACE INTO embeds VALUES (?, ?, ?)", (url, html, time.time()))
+
+	con.close()
+
+	return html
+
+def fetch_embeds(urls, endpoint=OEMBED_ENDPOINT, cache_path=EMBED_CACHE_PATH, deadline=EMBED_DEADLINE):
+	"""
+	Returns the embed html of the given tweets. Cached embeds are returned without a
+	request, the others are fetched in parallel on the shared thread pool. Fetches still
+	running after deadline seconds are returned as None so a slow endpoint can't stall
+	the page, they keep running and fill the cache for the next view. The call is recorded
+	as a metrics event with the number of cache hits, fetches, failures and unfinished
+	fetches.
+
+	Arguments:
+		urls (list): Tweet urls
+		endpoint (str): oEmbed endpoint url
+		cache_path (str): Path to the sqlite cache file
+		deadline (float): Maximum time to wait for fetches, in seconds
+	Returns:
+		dict: The embed html of each url, None for failed or unfinished fetches
+	"""
+
+	urls = list(dict.fromkeys(urls))
+
+	with metrics.timed("embed", "fetch_embeds", rows=len(urls)) as event:
+		embeds = get_cached_embeds(urls, cache_path)
+		futures = {}
+
+		with _lock:
+			for url in urls:
+				if url in embeds:
+					continue
+
+				future = _pending.get(url)
+
+				if future is None:
+					future = get_executor().submit(fetch_embed, url, endpoint, cache_path)
+					_pending[url] = future
+					future.add_done_callback(lambda future, url=url: _pending.pop(url, None))
+
+				futures[future] = url
+
+		event["hits"] = len(embeds)
+		event["misses"] = len(futures)
+
+		if futures:
+			done, not_done = wait(futures, timeout=deadline)
+
+			for future in done:
+				embeds[futures[future]] = future.result()
+
+			for future in not_done:
+				embeds[futures[future]] = None
+
+			logging.debug(f"Fetched {len(done)} embeds, {len(not_done)} still running after {deadline} s")
+
+			event["unfinished"] = len(not_done)
+
+		event["failed"] = sum(html is None for html in embeds.values())
+
+	return embeds
@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+METRICS_PATH = os.environ.get("METRICS_PATH", "./data/metrics.prom")
+METRICS_LOG = os.environ.get("METRICS_LOG", "0") == "1"
+METRICS_PREFIX = "congress_tweets_dashboard"
+
+# Structured json log of every recorded event, written to stderr when METRICS_LOG is set.
+# It never propagates to the root logger, so it stays off in processes that configure
+# root logging.
+logger = logging.getLogger("metrics")
+logger.propagate = False
+
+if METRICS_LOG:
+	handler = logging.StreamHandler(sys.stderr)
+	handler.setFormatter(logging.Formatter("%(message)s"))
+	logger.addHandler(handler)
+	logger.setLevel(logging.INFO)
+
+# Totals per kind and name since the process started, see record
+_totals = {}
+_lock = threading.Lock()
+
+# Events recorded by the script run of the current thread, see begin_run
+_run = threading.local()
+
+def begin_run():
+	"""
+	Starts collecting the events of the script run of the current thread.
+
+	Returns: N/A
+	"""
+
+	_run.events = []
+
+def get_run_events():
+	"""
+	Returns the events recorded since begin_run was called on the current thread.
+
+	Returns:
+		list: The recorded events in the order they ended
+	"""
+
+	return list(getattr(_run, "events", None) or [])
+
+def record(kind, name, seconds, rows=None, hits=0, misses=0, **fields):
+	"""
+	Records an event: adds it to the events of the current script run and to the process
+	totals, and logs it as json.
+
+	Arguments:
+		kind (str): The kind of event, e.g. query, section or embed
+		name (str): The name of the query, section or operation
+		seconds (float): Wall time of the event
+		rows (int): Number of rows or items returned, None if not applicable
+		hits (int): Number of cache hits
+		misses (int): Number of cache misses
+		fields: Additional fields of the event
+	Returns: N/A
+	"""
+
+	event = {"kind": kind, "name": name, "seconds": seconds, "rows": rows, "hits": hits, "misses": misses, **fields}
+
+	events = getattr(_run, "events", None)
+
+	if events is not None:
+		events.append(event)
+
+	with _lock:
+		totals = _totals.setdefault((kind, name), {"count": 0, "seconds": 0.0, "rows": 0, "hits": 0, "misses": 0})
+		totals["count"] += 1
+		totals["seconds"] += seconds
+		totals["rows"] += rows or 0
+		totals["hits"] += hits
+		totals["misses"] += misses
+
+	logger.info(json.dumps({"time": time.time(), **event}, default=str))
+
+@contextmanager
+def timed(kind, name, **fields):
+	"""
+	Records the wall time of the enclosed block as an event. The yielded dict can be used
+	to set the rows, hits, misses and other fields of the event. The time spent in
+	queries and embed fetches recorded within the block is reported as child_seconds.
+
+	Arguments:
+		kind (str): The kind of event
+		name (str): The name of the event
+		fields: Initial fields of the event
+	"""
+
+	event = dict(fields)
+	count_events = len(getattr(_run, "events", None) or [])
+	start_time = time.perf_counter()
+
+	try:
+		yield event
+	finally:
+		seconds = time.perf_counter() - start_time
+
+		if kind == "section":
+			children = get_run_events()[count_events:]
+			event["child_seconds"] = sum(child["seconds"] for child in children if child["kind"] in ("query", "embed"))
+
+		record(kind, name, seconds, **event)
+
+def write_prometheus(path=METRICS_PATH):
+	"""
+	Writes the process totals in the Prometheus text format, for a node exporter textfile
+	collector or any scraper reading the file. The file is replaced atomically.
+
+	Arguments:
+		path (str): Path of the metrics file, nothing is written if empty
+	Returns: N/A
+	"""
+
+	if not path:
+		return
+
+	with _lock:
+		totals = {key: dict(value) for key, value in _totals.items()}
+
+	lines = []
+
+	for metric, field, description in (
+		("events_total", "count", "Number of recorded events"),
+		("seconds_total", "seconds", "Wall time of recorded events in seconds"),
+		("rows_total", "rows", "Rows or items returned by recorded events"),
+		("cache_hits_total", "hits", "Cache hits of recorded events"),
+		("cache_misses_total", "misses", "Cache misses of recorded events")
+	):
+		lines.append(f"# HELP {METRICS_PREFIX}_{metric} {description}")
+		lines.append(f"# TYPE {METRICS_PREFIX}_{metric} counter")
+
+		for (kind, name), values in sorted(totals.items()):
+			lines.append(f'{METRICS_PREFIX}_{metric}{{kind="{kind}",name="{name}"}} {values[field]}')
+
+	os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+	tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+
+	with open(tmp_path, "w", encoding="utf8") as fout:
+		fout.write("\n".join(lines) + "\n")
+
+	os.replace(tmp_path, path)
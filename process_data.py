@@ -1,133 +1,1053 @@
 import time
 import os
+import argparse
 import glob
+import hashlib
 import json
+import math
+import shutil
 import logging
+import re
+import resource
+import string
+import sqlite3
+import sys
+from importlib.metadata import version
 from multiprocessing import Pool
 
 import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
-import pandas as pd
-import numpy as np
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer, BOOSTER_DICT, NEGATE, SPECIAL_CASES, C_INCR, N_SCALAR
 
 DB_PATH = "./data/tweets_sentiment.duckdb"
+DB_SCHEMA_VERSION = 5
+TWEETS_SCHEMA_VERSION = 2
+DB_ROW_GROUP_SIZE = 122880
+EXTREME_TWEETS_PER_MONTH = 10
+MANIFEST_PATH = "./data/tweets_manifest.json"
+PARTITIONS_MANIFEST_PATH = "./data/tweets_partitions.json"
+ACCOUNTS_MANIFEST_PATH = "./data/accounts_manifest.json"
+PIPELINE_STATE_PATH = "./data/pipeline_state.json"
+SENTIMENT_CACHE_PATH = "./data/sentiment_cache.sqlite"
+SENTIMENT_BACKEND = os.environ.get("SENTIMENT_BACKEND", "vader")
+FAST_SCORER_VADER_VERSION = "3.3.2"
+TWEETS_DATASET_PATH = "./data/tweets"
+ACCOUNTS_JSON_PATH = "./data/json/accounts/accounts.json"
+RAW_ACCOUNTS_PARQUET_PATH = "./data/parquet/accounts/accounts.parquet"
+ACCOUNTS_PARQUET_PATH = "./data/accounts.parquet"
+TWEETS_BATCH_SIZE = 10000
+JSON_READ_CHUNK_SIZE = 1 << 16
+JSON_WHITESPACE_PATTERN = re.compile(r"[ \t\n\r]*")
+
+# Values of the party and account type enums in the duckdb database
+PARTIES = ("D", "R", "I", "L")
+ACCOUNT_TYPES = ("member", "committee", "caucus", "party")
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+# Tweets as they appear in the json files
+RAW_TWEETS_SCHEMA = pa.schema([
+	("id", pa.string()),
+	("screen_name", pa.string()),
+	("time", pa.string()),
+	("link", pa.string()),
+	("text", pa.string()),
+	("source", pa.string()),
+	("user_id", pa.string()),
+	("sentiment", pa.float64())
+])
+
+# Tweets as they are written to parquet after scoring. Daily files written with an older
+# schema are scored again, see TWEETS_SCHEMA_VERSION and get_changed_files
+TWEETS_SCHEMA = pa.schema([
+	("id", pa.int64()),
+	("screen_name", pa.dictionary(pa.int32(), pa.string())),
+	("created_at", pa.timestamp("us", tz="UTC")),
+	("link", pa.string()),
+	("text", pa.string()),
+	("source", pa.dictionary(pa.int32(), pa.string())),
+	("user_id", pa.int64()),
+	("sentiment", pa.float32())
+])
+
+# Twitter accounts with the details of the legislator or committee that owns them
+ACCOUNTS_SCHEMA = pa.schema([
+	("id", pa.string()),
+	("screen_name", pa.string()),
+	("account_type", pa.string()),
+	("name", pa.string()),
+	("chamber", pa.string()),
+	("type", pa.string()),
+	("party", pa.string()),
+	("state", pa.string())
+])
+
 logging.basicConfig(level=logging.DEBUG, format=f"%(levelname)s: %(message)s\n")
 
-def analyze_sentiment(tweet):
+# VADER analyzer, scoring backend and fast scorer tables for the current process, see
+# init_sentiment_worker
+_analyzer = None
+_sentiment_backend = SENTIMENT_BACKEND
+_fast_scorer = None
+
+# Connection to the sentiment cache for the current process and the cache hits and
+# misses of the file being processed, see get_sentiment_cache
+_sentiment_cache = None
+_sentiment_cache_stats = {"hits": 0, "misses": 0}
+
+def init_sentiment_worker(backend=SENTIMENT_BACKEND):
 	"""
-	Analyzes the sentiment of a single tweet and returns the original tweet object
-	with the sentiment field added.
+	Pool initializer that builds one VADER analyzer per worker process. Loading the
+	lexicon and emoji tables is more expensive than scoring a tweet, so it should only
+	happen once per process rather than once per tweet.
 
 	Arguments:
-		tweet (dict): The tweet object containing the tweet text and other relevant fields
+		backend (str): The scoring backend, vader for the reference analyzer or fast for
+			score_compound_fast
+	Returns: N/A
+	"""
+
+	global _analyzer, _sentiment_backend, _fast_scorer
+	_analyzer = SentimentIntensityAnalyzer()
+	_sentiment_backend = backend
+	_fast_scorer = build_fast_scorer(_analyzer) if backend == "fast" else None
+
+def get_analyzer():
+	"""
+	Returns the analyzer for the current process, creating it on first use.
+
+	Parameters: N/A
 	Returns:
-		dict: The tweet object with the sentiment field added or None if the tweet could
-			not be abalyzed
+		SentimentIntensityAnalyzer: The process-wide VADER analyzer
 	"""
 
-	analyzer = SentimentIntensityAnalyzer()
+	if _analyzer is None:
+		init_sentiment_worker()
 
-	try:
-		tweet["sentiment"] = analyzer.polarity_scores(tweet["text"]).get("compound")
-	except KeyError as e:
-		print(f"Unable to process tweet {tweet}")
-		return None
+	return _analyzer
+
+def check_fast_scorer_version():
+	"""
+	Checks that the installed vaderSentiment is the version score_compound_fast
+	reproduces. The fast scorer copies the rules of FAST_SCORER_VADER_VERSION, so another
+	version could silently score texts differently from the reference analyzer. Run
+	benchmark.py sentiment to check parity before updating FAST_SCORER_VADER_VERSION.
+
+	Parameters: N/A
+	Returns: N/A
+	"""
+
+	if version("vaderSentiment") != FAST_SCORER_VADER_VERSION:
+		raise RuntimeError(f"The fast sentiment scorer reproduces vaderSentiment {FAST_SCORER_VADER_VERSION}, found {version('vaderSentiment')}. Use the vader backend instead.")
+
+def build_fast_scorer(analyzer):
+	"""
+	Preprocesses the lexicons of a VADER analyzer for score_compound_fast: the emojis
+	are compiled into a single regex, and the words that can start a special case or
+	booster phrase are collected so that most words skip the phrase checks. Refuses to
+	run with another vaderSentiment than FAST_SCORER_VADER_VERSION.
+
+	Arguments:
+		analyzer (SentimentIntensityAnalyzer): The reference analyzer
+	Returns:
+		dict: The lexicon, emoji and phrase tables
+	"""
+
+	check_fast_scorer_version()
 
-	return tweet
+	# The reference analyzer replaces emojis one character at a time, so longer keys
+	# never match
+	emojis = {emoji: description for emoji, description in analyzer.emojis.items() if len(emoji) == 1}
+	phrases = list(SPECIAL_CASES) + [booster for booster in BOOSTER_DICT if " " in booster]
 
-def process_json_tweets_data():
+	# Match the emojis with a character class of code point ranges, which the regex
+	# engine checks much faster than a class of individual characters
+	emoji_ranges = []
+
+	for code_point in sorted(ord(emoji) for emoji in emojis):
+		if emoji_ranges and emoji_ranges[-1][1] == code_point - 1:
+			emoji_ranges[-1][1] = code_point
+		else:
+			emoji_ranges.append([code_point, code_point])
+
+	emoji_class = "".join(f"{re.escape(chr(first))}-{re.escape(chr(last))}" for first, last in emoji_ranges)
+
+	return {
+		"lexicon": analyzer.lexicon,
+		"emojis": emojis,
+		"emoji_pattern": re.compile(f"[{emoji_class}]"),
+		"negations": frozenset(NEGATE),
+		"phrase_words": frozenset(word for phrase in phrases for word in phrase.split())
+	}
+
+def get_fast_scorer():
 	"""
-	Get all the json files from the /data/json directory, analyze the tweet sentiment
-	and write to parquet files. Uses multiprocessing to speed up workload.
+	Returns the fast scorer tables for the current process, building them on first use.
 
 	Parameters: N/A
+	Returns:
+		dict: The tables built by build_fast_scorer
+	"""
+
+	global _fast_scorer
+
+	if _fast_scorer is None:
+		_fast_scorer = build_fast_scorer(get_analyzer())
+
+	return _fast_scorer
+
+def score_compound_fast(text, scorer):
+	"""
+	Computes the VADER compound score of a text with the same rules and arithmetic as
+	SentimentIntensityAnalyzer.polarity_scores. Each word is lowercased once instead of
+	once per rule, words outside the lexicon are skipped without running the rules, and
+	only the compound score is computed.
+
+	Arguments:
+		text (str): The text to score
+		scorer (dict): The tables built by build_fast_scorer
+	Returns:
+		float: The compound score, rounded to 4 decimals like the reference
+	"""
+
+	lexicon = scorer["lexicon"]
+	negations = scorer["negations"]
+	phrase_words = scorer["phrase_words"]
+
+	# Replace emojis by their description, separated from the preceding character. None
+	# of the emojis are ascii, so most tweets skip the search.
+	if not text.isascii() and scorer["emoji_pattern"].search(text):
+		emojis = scorer["emojis"]
+		text = scorer["emoji_pattern"].sub(
+			lambda match: (" " if match.start() > 0 and text[match.start() - 1] != " " else "") + emojis[match.group()],
+			text
+		)
+
+	text = text.strip()
+
+	# Strip the punctuation around words, keeping emoticons that would be left too short
+	words = []
+
+	for word in text.split():
+		stripped = word.strip(string.punctuation)
+		words.append(word if len(stripped) <= 2 else stripped)
+
+	if not words:
+		return 0.0
+
+	lower = [word.lower() for word in words]
+	count_words = len(words)
+	count_upper = sum(1 for word in words if word.isupper())
+	is_cap_diff = 0 < count_words - count_upper < count_words
+	sentiments = []
+
+	for i, word in enumerate(lower):
+		if word not in lexicon or word in BOOSTER_DICT or (word == "kind" and i < count_words - 1 and lower[i + 1] == "of"):
+			sentiments.append(0)
+			continue
+
+		valence = lexicon[word]
+
+		if word == "no" and i != count_words - 1 and lower[i + 1] in lexicon:
+			valence = 0.0
+
+		if (i > 0 and lower[i - 1] == "no") or (i > 1 and lower[i - 2] == "no") or (i > 2 and lower[i - 3] == "no" and lower[i - 1] in ("or", "nor")):
+			valence = lexicon[word] * N_SCALAR
+
+		if words[i].isupper() and is_cap_diff:
+			if valence > 0:
+				valence += C_INCR
+			else:
+				valence -= C_INCR
+
+		for start_i in range(3):
+			previous = i - (start_i + 1)
+
+			if previous < 0 or lower[previous] in lexicon:
+				continue
+
+			# Boosters and dampeners in the three preceding words
+			scalar = 0.0
+
+			if lower[previous] in BOOSTER_DICT:
+				scalar = BOOSTER_DICT[lower[previous]]
+
+				if valence < 0:
+					scalar *= -1
+
+				if words[previous].isupper() and is_cap_diff:
+					if valence > 0:
+						scalar += C_INCR
+					else:
+						scalar -= C_INCR
+
+			if start_i == 1 and scalar != 0:
+				scalar = scalar * 0.95
+			if start_i == 2 and scalar != 0:
+				scalar = scalar * 0.9
+
+			valence = valence + scalar
+
+			# Negations in the three preceding words
+			if start_i == 0:
+				if lower[i - 1] in negations or "n't" in lower[i - 1]:
+					valence = valence * N_SCALAR
+			elif start_i == 1:
+				if lower[i - 2] == "never" and lower[i - 1] in ("so", "this"):
+					valence = valence * 1.25
+				elif lower[i - 2] == "without" and lower[i - 1] == "doubt":
+					pass
+				elif lower[i - 2] in negations or "n't" in lower[i - 2]:
+					valence = valence * N_SCALAR
+			else:
+				if (lower[i - 3] == "never" and lower[i - 2] in ("so", "this")) or lower[i - 1] in ("so", "this"):
+					valence = valence * 1.25
+				elif lower[i - 3] == "without" and (lower[i - 2] == "doubt" or lower[i - 1] == "doubt"):
+					pass
+				elif lower[i - 3] in negations or "n't" in lower[i - 3]:
+					valence = valence * N_SCALAR
+
+				# Special case and booster phrases around the word
+				if not phrase_words.isdisjoint(lower[i - 3:i + 3]):
+					valence = get_phrase_valence(valence, lower, i)
+
+		# Negation with "least", unless "at least" or "very least"
+		if i > 1 and lower[i - 1] not in lexicon and lower[i - 1] == "least":
+			if lower[i - 2] != "at" and lower[i - 2] != "very":
+				valence = valence * N_SCALAR
+		elif i > 0 and lower[i - 1] not in lexicon and lower[i - 1] == "least":
+			valence = valence * N_SCALAR
+
+		sentiments.append(valence)
+
+	# Contrastive "but", reproducing the reference, which finds each sentiment by value
+	if "but" in lower:
+		but_index = lower.index("but")
+
+		for sentiment in sentiments:
+			sentiment_index = sentiments.index(sentiment)
+
+			if sentiment_index < but_index:
+				sentiments.pop(sentiment_index)
+				sentiments.insert(sentiment_index, sentiment * 0.5)
+			elif sentiment_index > but_index:
+				sentiments.pop(sentiment_index)
+				sentiments.insert(sentiment_index, sentiment * 1.5)
+
+	sum_sentiments = float(sum(sentiments))
+
+	# Emphasis from up to 4 exclamation points and from 2 or more question marks
+	count_question_marks = text.count("?")
+	amplifier = min(text.count("!"), 4) * 0.292
+
+	if count_question_marks > 1:
+		amplifier += count_question_marks * 0.18 if count_question_marks <= 3 else 0.96
+
+	if sum_sentiments > 0:
+		sum_sentiments += amplifier
+	elif sum_sentiments < 0:
+		sum_sentiments -= amplifier
+
+	compound = sum_sentiments / math.sqrt((sum_sentiments * sum_sentiments) + 15)
+
+	return round(min(max(compound, -1.0), 1.0), 4)
+
+def get_phrase_valence(valence, lower, i):
+	"""
+	Applies the special case phrases, such as "the shit" or "bad ass", and the booster
+	phrases, such as "kind of", around the word at index i, as the reference analyzer's
+	_special_idioms_check does.
+
+	Arguments:
+		valence (float): The valence of the word so far
+		lower (list): The lowercased words of the text
+		i (int): Index of the word, at least 3
+	Returns:
+		float: The adjusted valence
+	"""
+
+	onezero = f"{lower[i - 1]} {lower[i]}"
+	twoonezero = f"{lower[i - 2]} {lower[i - 1]} {lower[i]}"
+	twoone = f"{lower[i - 2]} {lower[i - 1]}"
+	threetwoone = f"{lower[i - 3]} {lower[i - 2]} {lower[i - 1]}"
+	threetwo = f"{lower[i - 3]} {lower[i - 2]}"
+
+	for sequence in (onezero, twoonezero, twoone, threetwoone, threetwo):
+		if sequence in SPECIAL_CASES:
+			valence = SPECIAL_CASES[sequence]
+			break
+
+	if len(lower) - 1 > i:
+		zeroone = f"{lower[i]} {lower[i + 1]}"
+		if zeroone in SPECIAL_CASES:
+			valence = SPECIAL_CASES[zeroone]
+
+	if len(lower) - 1 > i + 1:
+		zeroonetwo = f"{lower[i]} {lower[i + 1]} {lower[i + 2]}"
+		if zeroonetwo in SPECIAL_CASES:
+			valence = SPECIAL_CASES[zeroonetwo]
+
+	for n_gram in (threetwoone, threetwo, twoone):
+		if n_gram in BOOSTER_DICT:
+			valence = valence + BOOSTER_DICT[n_gram]
+
+	return valence
+
+def score_texts(texts):
+	"""
+	Computes the compound score of a list of texts with the scoring backend of the
+	current process.
+
+	Arguments:
+		texts (list): The texts to score
+	Returns:
+		list: The compound score of each text
+	"""
+
+	if _sentiment_backend == "fast":
+		scorer = get_fast_scorer()
+		return [score_compound_fast(text, scorer) for text in texts]
+
+	analyzer = get_analyzer()
+
+	return [analyzer.polarity_scores(text)["compound"] for text in texts]
+
+def prepare_sentiment_cache(path=SENTIMENT_CACHE_PATH, backend=SENTIMENT_BACKEND):
+	"""
+	Creates the sentiment cache if needed and clears it when its scores were computed by
+	another version of vaderSentiment, whose lexicon or rules may score texts differently,
+	or by another scoring backend. Called once before the workers start so they never
+	race on the invalidation.
+
+	Arguments:
+		path (str): Path to the sqlite cache file
+		backend (str): The scoring backend filling the cache
+	Returns: N/A
+	"""
+
+	vader_version = f"{version('vaderSentiment')}/{backend}"
+
+	con = sqlite3.connect(path, timeout=60)
+	con.execute("PRAGMA journal_mode=WAL")
+
+	with con:
+		con.execute("CREATE TABLE IF NOT EXISTS scores (text_hash BLOB PRIMARY KEY, compound REAL) WITHOUT ROWID")
+		con.execute("CREATE TABLE IF NOT EXISTS cache_info (key TEXT PRIMARY KEY, value TEXT)")
+
+		cached_version = con.execute("SELECT value FROM cache_info WHERE key = 'vader_version'").fetchone()
+
+		if cached_version is None or cached_version[0] != vader_version:
+			logging.info(f"Clearing sentiment cache built with vaderSentiment {cached_version[0] if cached_version else 'unknown'}, now {vader_version}")
+			con.execute("DELETE FROM scores")
+			con.execute("INSERT OR REPLACE INTO cache_info VALUES ('vader_version', ?)", (vader_version,))
+
+	con.close()
+
+def get_sentiment_cache(path=SENTIMENT_CACHE_PATH):
+	"""
+	Returns the connection to the sentiment cache for the current process, opening it on
+	first use.
+
+	Arguments:
+		path (str): Path to the sqlite cache file
+	Returns:
+		sqlite3.Connection: Connection to the sentiment cache
+	"""
+
+	global _sentiment_cache
+
+	if _sentiment_cache is None:
+		prepare_sentiment_cache(path, _sentiment_backend)
+		_sentiment_cache = sqlite3.connect(path, timeout=60)
+
+	return _sentiment_cache
+
+def get_text_hash(text):
+	"""
+	Returns the sentiment cache key of a tweet text. VADER splits texts on whitespace, so
+	texts that only differ in whitespace share a key and a score.
+
+	Arguments:
+		text (str): The tweet text
+	Returns:
+		bytes: The 16 byte hash of the whitespace-normalized text
+	"""
+
+	return hashlib.blake2b(" ".join(text.split()).encode("utf8"), digest_size=16).digest()
+
+def analyze_sentiment_batch(tweets):
+	"""
+	Analyzes the sentiment of a list of tweets with the analyzer of the current process.
+	Retweets and texts cross-posted by several accounts are common, so scores are looked
+	up in the sentiment cache first and each new text is only scored once.
+
+	Arguments:
+		tweets (list): The tweet objects to analyze
+	Returns:
+		list: The analyzed tweet objects, without the tweets that could not be analyzed
+	"""
+
+	tweets_analyzed = []
+
+	for tweet in tweets:
+		if isinstance(tweet.get("text"), str):
+			tweets_analyzed.append(tweet)
+		else:
+			print(f"Unable to process tweet {tweet}")
+
+	cache = get_sentiment_cache()
+	hashes = [get_text_hash(tweet["text"]) for tweet in tweets_analyzed]
+	unique_hashes = list(dict.fromkeys(hashes))
+	scores = {}
+
+	# Look up the scores in chunks below the sqlite parameter limit
+	for i in range(0, len(unique_hashes), 500):
+		chunk = unique_hashes[i:i + 500]
+		scores.update(cache.execute(f"SELECT text_hash, compound FROM scores WHERE text_hash IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+
+	# Score the texts missing from the cache in one batch
+	missing_texts = {}
+
+	for tweet, text_hash in zip(tweets_analyzed, hashes):
+		if text_hash not in scores:
+			missing_texts.setdefault(text_hash, tweet["text"])
+
+	new_scores = dict(zip(missing_texts, score_texts(list(missing_texts.values()))))
+	scores.update(new_scores)
+
+	_sentiment_cache_stats["hits"] += len(tweets_analyzed) - len(new_scores)
+	_sentiment_cache_stats["misses"] += len(new_scores)
+
+	for tweet, text_hash in zip(tweets_analyzed, hashes):
+		tweet["sentiment"] = scores[text_hash]
+
+	with cache:
+		cache.executemany("INSERT OR IGNORE INTO scores VALUES (?, ?)", new_scores.items())
+
+	return tweets_analyzed
+
+def get_file_hash(path):
+	"""
+	Computes the sha256 hash of a file without reading it into memory all at once.
+
+	Arguments:
+		path (str): Path to the file to hash
+	Returns:
+		str: The hex digest of the file contents
+	"""
+
+	file_hash = hashlib.sha256()
+
+	with open(path, "rb") as fin:
+		for block in iter(lambda: fin.read(1 << 20), b""):
+			file_hash.update(block)
+
+	return file_hash.hexdigest()
+
+def get_tweets_parquet_path(json_path):
+	"""
+	Returns the parquet output path for a daily json tweets file.
+
+	Arguments:
+		json_path (str): Path to the json tweets file
+	Returns:
+		str: Path to the matching parquet file
+	"""
+
+	return f"./data/parquet/{os.path.basename(json_path).replace('.json', '')}.parquet"
+
+def load_manifest(path=MANIFEST_PATH):
+	"""
+	Loads a manifest file. The default manifest tracks the processed json tweets files,
+	with each entry keyed by the json file path and recording its size, mtime, content
+	hash, parquet output path and the schema version of the parquet output.
+
+	Arguments:
+		path (str): Path to the manifest file
+	Returns:
+		dict: The manifest entries, empty if no manifest exists yet
+	"""
+
+	if not os.path.exists(path):
+		return {}
+
+	with open(path, "r", encoding="utf8") as fin:
+		return json.load(fin)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+	"""
+	Writes a manifest to disk. The file is written to a temporary path first and then
+	moved into place so that an interrupted run never leaves a truncated manifest.
+
+	Arguments:
+		manifest (dict): The manifest entries to write
+		path (str): Path to the manifest file
+	Returns: N/A
+	"""
+
+	with open(f"{path}.tmp", "w", encoding="utf8") as fout:
+		json.dump(manifest, fout, indent="\t", sort_keys=True)
+
+	os.replace(f"{path}.tmp", path)
+
+def get_changed_files(files, manifest):
+	"""
+	Compares json tweets files against the manifest and returns the ones that need to be
+	processed. Files whose size and mtime match the manifest are skipped without reading
+	them. Files that were touched but whose content hash is unchanged are skipped as well
+	and their manifest entry is refreshed. Files whose parquet output was written with
+	another TWEETS_SCHEMA_VERSION are processed again, entries without a version were
+	written with the raw string schema.
+
+	Arguments:
+		files (list): Paths of the json tweets files
+		manifest (dict): The manifest entries, updated in place for touched files
+	Returns:
+		list: Paths of the new or modified files
+	"""
+
+	changed_files = []
+
+	for current_file in files:
+		entry = manifest.get(current_file)
+		stat = os.stat(current_file)
+
+		if entry is None or entry.get("schema_version") != TWEETS_SCHEMA_VERSION or not os.path.exists(entry["output"]):
+			changed_files.append(current_file)
+		elif entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+			continue
+		elif entry["size"] == stat.st_size and entry["sha256"] == get_file_hash(current_file):
+			entry["mtime"] = stat.st_mtime
+		else:
+			changed_files.append(current_file)
+
+	return changed_files
+
+def iter_json_array(fin, chunk_size=JSON_READ_CHUNK_SIZE):
+	"""
+	Incrementally parses a json array from a file and yields its items one at a time.
+	Only a window of the file is kept in memory, so memory use does not grow with the
+	size of the file. The file is rejected like json.load would reject it: items must be
+	separated by exactly one comma, and nothing but whitespace may follow the array.
+
+	Arguments:
+		fin (file): Text file object positioned at the start of a json array
+		chunk_size (int): Number of characters to read from the file at a time
+	Returns:
+		generator: The parsed items of the array
+	"""
+
+	decoder = json.JSONDecoder()
+	buffer = ""
+	pos = 0
+	eof = False
+	read_more = False
+
+	# What comes next: the opening bracket, the first item or the closing bracket, a
+	# comma or the closing bracket, an item after a comma, or the end of the file
+	expected = "array"
+
+	while True:
+		pos = JSON_WHITESPACE_PATTERN.match(buffer, pos).end()
+
+		# Read the next chunk when the buffer is consumed or ends in the middle of an item
+		if (pos == len(buffer) or read_more) and not eof:
+			chunk = fin.read(chunk_size)
+			eof = not chunk
+			buffer = buffer[pos:] + chunk
+			pos = 0
+			read_more = False
+			continue
+
+		if expected == "end":
+			if pos < len(buffer):
+				raise ValueError(f"Unexpected data after the json array: {buffer[pos:pos + 20]!r}")
+			return
+
+		if expected == "array":
+			if not buffer.startswith("[", pos):
+				raise ValueError("Expected a json array")
+			expected = "first_item"
+			pos += 1
+			continue
+
+		if pos == len(buffer):
+			raise ValueError("Unterminated json array")
+
+		if expected in ("first_item", "separator") and buffer.startswith("]", pos):
+			expected = "end"
+			pos += 1
+			continue
+
+		if expected == "separator":
+			if not buffer.startswith(",", pos):
+				raise ValueError(f"Expected ',' or ']' between json array items, found {buffer[pos:pos + 20]!r}")
+			expected = "item"
+			pos += 1
+			continue
+
+		try:
+			item, end = decoder.raw_decode(buffer, pos)
+		except json.JSONDecodeError:
+			# The item is cut off at the end of the buffer, read more and retry
+			if eof:
+				raise
+			read_more = True
+			continue
+
+		# An item is only complete once a comma or the closing bracket follows, a number
+		# cut off at the end of the buffer may continue in the next chunk
+		if not eof and not buffer.startswith((",", "]"), JSON_WHITESPACE_PATTERN.match(buffer, end).end()):
+			read_more = True
+			continue
+
+		pos = end
+		expected = "separator"
+
+		yield item
+
+def tweets_to_record_batch(tweets):
+	"""
+	Converts analyzed tweet objects to an arrow record batch with the TWEETS_SCHEMA
+	column types. The tweet time is parsed once here so that downstream stages can use
+	created_at directly.
+
+	Arguments:
+		tweets (list): The analyzed tweet objects
+	Returns:
+		pyarrow.RecordBatch: The tweets in TWEETS_SCHEMA
+	"""
+
+	raw = pa.RecordBatch.from_pylist(tweets, schema=RAW_TWEETS_SCHEMA)
+
+	return pa.RecordBatch.from_arrays([
+		pc.cast(raw["id"], pa.int64()),
+		pc.dictionary_encode(raw["screen_name"]),
+		pc.cast(pc.strptime(raw["time"], format=TIME_FORMAT, unit="s"), pa.timestamp("us", tz="UTC")),
+		raw["link"],
+		raw["text"],
+		pc.dictionary_encode(raw["source"]),
+		pc.cast(raw["user_id"], pa.int64()),
+		pc.cast(raw["sentiment"], pa.float32())
+	], schema=TWEETS_SCHEMA)
+
+def iter_tweet_batches(path, batch_size=TWEETS_BATCH_SIZE):
+	"""
+	Streams the tweets of a json tweets file, analyzes their sentiment and yields them
+	as arrow record batches of at most batch_size rows.
+
+	Arguments:
+		path (str): Path to the json tweets file
+		batch_size (int): Maximum number of tweets per record batch
+	Returns:
+		generator: Record batches matching TWEETS_SCHEMA
+	"""
+
+	tweets = []
+
+	with open(path, "r", encoding="utf8") as fin:
+		for tweet in iter_json_array(fin):
+			tweets.append(tweet)
+
+			if len(tweets) == batch_size:
+				yield tweets_to_record_batch(analyze_sentiment_batch(tweets))
+				tweets = []
+
+	if tweets:
+		yield tweets_to_record_batch(analyze_sentiment_batch(tweets))
+
+def get_peak_memory_mb():
+	"""
+	Returns the peak resident set size of the current process over its lifetime, see
+	benchmark.py memory for the peak of processing a single file.
+
+	Parameters: N/A
+	Returns:
+		float: The peak RSS in megabytes
+	"""
+
+	peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	# ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+	return peak_rss / (1 << 20) if sys.platform == "darwin" else peak_rss / (1 << 10)
+
+def process_json_file(current_file, batch_size=TWEETS_BATCH_SIZE):
+	"""
+	Streams a single json tweets file, analyzes the tweet sentiment and writes the result
+	to the matching parquet file batch by batch, so memory is bounded by the batch size
+	rather than the size of the file. Runs inside a pool worker so that each worker owns
+	a file end to end.
+
+	Arguments:
+		current_file (str): Path to the json file to process
+		batch_size (int): Maximum number of tweets held in memory at a time
+	Returns:
+		tuple: The processed file path, the number of tweets written, the manifest entry
+			for the file and the sentiment cache hits and misses
+	"""
+
+	stat = os.stat(current_file)
+	output = get_tweets_parquet_path(current_file)
+	count_tweets = 0
+	_sentiment_cache_stats.update(hits=0, misses=0)
+
+	# Write to a temporary file first so a crash never leaves a partial parquet file
+	with pq.ParquetWriter(f"{output}.tmp", TWEETS_SCHEMA) as writer:
+		for batch in iter_tweet_batches(current_file, batch_size):
+			writer.write_batch(batch)
+			count_tweets += batch.num_rows
+
+	os.replace(f"{output}.tmp", output)
+
+	logging.debug(f"Wrote {output} ({count_tweets} tweets)")
+
+	entry = {
+		"size": stat.st_size,
+		"mtime": stat.st_mtime,
+		"sha256": get_file_hash(current_file),
+		"output": output,
+		"schema_version": TWEETS_SCHEMA_VERSION
+	}
+
+	return current_file, count_tweets, entry, dict(_sentiment_cache_stats)
+
+def process_json_tweets_data(workers=None, force=False, backend=SENTIMENT_BACKEND):
+	"""
+	Get the new or modified json files from the /data/json directory, analyze the tweet
+	sentiment and write to parquet files. Files that are unchanged since the last run,
+	according to the manifest, are skipped. Uses multiprocessing to speed up workload,
+	with each worker processing whole files.
+
+	Arguments:
+		workers (int): Number of worker processes, defaults to the number of cores
+		force (bool): If enabled, all files are processed regardless of the manifest
+		backend (str): The scoring backend, vader for the reference analyzer or fast for
+			score_compound_fast
 	Returns: N/A
 	"""
 
 	logging.info("Processing json tweets data...")
 
 	# Initialize helper variables
-	tweets = []
+	count_tweets = 0
+	cache_stats = {"hits": 0, "misses": 0}
+	start_time = time.perf_counter()
+	workers = workers or os.cpu_count()
 
-	# Initialize multiprocessing pool
-	pool = Pool(processes=4)
+	# Find all json data files and keep the ones that changed since the last run
+	files = sorted(glob.glob("./data/json/*.json"))
+	manifest = {} if force else load_manifest()
+	changed_files = get_changed_files(files, manifest)
 
-	# Find all json data files
-	files = glob.glob("./data/json/*.json")
+	logging.info(f"Found {len(changed_files)} new or modified files, skipping {len(files) - len(changed_files)} unchanged files")
 
-	for current_file in files:
-		with open(current_file, "r", encoding="utf8") as fin:
+	# Fail before starting the pool, a failing pool initializer would restart forever
+	if backend == "fast":
+		check_fast_scorer_version()
+
+	prepare_sentiment_cache(backend=backend)
 
-			# Load and analyze tweets
-			tweets = json.load(fin)
-			tweets_analyzed = pool.map(analyze_sentiment, tweets)
-			tweets_analyzed = list(filter(lambda x: x is not None, tweets_analyzed))
+	# Initialize multiprocessing pool with one analyzer per worker
+	with Pool(processes=workers, initializer=init_sentiment_worker, initargs=(backend,)) as pool:
+		for current_file, count_file_tweets, entry, file_cache_stats in pool.imap_unordered(process_json_file, changed_files):
+			count_tweets += count_file_tweets
+			cache_stats["hits"] += file_cache_stats["hits"]
+			cache_stats["misses"] += file_cache_stats["misses"]
+			logging.debug(f"Processed {current_file} ({count_file_tweets} tweets)")
 
-			# Convert to pandas df and write to parquet file
-			df = pd.DataFrame(tweets_analyzed)
-			df.to_parquet(f"./data/parquet/{os.path.basename(current_file).replace('.json', '')}.parquet")
+			# Checkpoint the manifest after every file so a crashed run resumes without
+			# scoring finished files again
+			manifest[current_file] = entry
+			save_manifest(manifest)
 
+	# Save the refreshed entries of touched but unchanged files
+	save_manifest(manifest)
+
+	elapsed = time.perf_counter() - start_time
+	logging.info(f"Scored {count_tweets} tweets from {len(changed_files)} files with {workers} workers in {elapsed:.1f}s ({count_tweets / max(elapsed, 1e-9):.0f} tweets/sec)")
+	logging.info(f"Sentiment cache: {cache_stats['hits']} hits, {cache_stats['misses']} texts scored ({cache_stats['hits'] / max(count_tweets, 1):.0%} hit rate)")
 	logging.info("Done.")
 
-def process_json_accounts_data():
+def process_json_accounts_data(path=ACCOUNTS_JSON_PATH, output_path=RAW_ACCOUNTS_PARQUET_PATH):
 	"""
-	Get all the json files from the /data/json/accounts directory and write accounts to
-	parquet file.
+	Get the accounts json file from the /data/json/accounts directory and write accounts
+	to parquet file. Each legislator or committee lists one or more twitter accounts, which
+	are unnested in duckdb into one row per account with the details of its owner.
 
-	Parameters: N/A
+	Arguments:
+		path (str): Path to the accounts json file
+		output_path (str): Path to the accounts parquet file
 	Returns: N/A
 	"""
 
 	logging.info("Processing json accounts data...")
 
-	with open("./data/json/accounts/accounts.json", "r", encoding="utf8") as fin:
-		accounts = []
-
-		users = json.load(fin)
-		df = pd.DataFrame(users)
-		df = df.replace({np.nan: None})
-		df = df.replace({"N/A": None})
-
-		# Iterate over rows and grab all accounts for each row
-		for index, row in df.iterrows():
-			for account in row["accounts"]:
-				accounts.append({
-					"id": account["id"],
-					"screen_name": account["screen_name"],
-					"account_type": account["account_type"],
-					"name": row["name"],
-					"chamber": row["chamber"],
-					"type": row["type"],
-					"party": row["party"],
-					"state": row["state"]
-				})
-
-		# Create an accounts dataframe and write to parquet file
-		df_accounts = pd.DataFrame(accounts)
-		df_accounts.to_parquet("./data/parquet/accounts/accounts.parquet")
-	
+	con = duckdb.connect()
+
+	# Missing values and "N/A" in the owner details are stored as nulls
+	accounts_table = con.execute("""--sql
+		SELECT
+			account.id,
+			account.screen_name,
+			account.account_type,
+			NULLIF(name, 'N/A') AS name,
+			NULLIF(chamber, 'N/A') AS chamber,
+			NULLIF(type, 'N/A') AS type,
+			NULLIF(party, 'N/A') AS party,
+			NULLIF(state, 'N/A') AS state
+		FROM (
+			SELECT
+				name,
+				chamber,
+				type,
+				party,
+				state,
+				UNNEST(accounts) AS account
+			FROM read_json($path, format = 'array', columns = {
+				'name': 'VARCHAR',
+				'chamber': 'VARCHAR',
+				'type': 'VARCHAR',
+				'party': 'VARCHAR',
+				'state': 'VARCHAR',
+				'accounts': 'STRUCT(id VARCHAR, screen_name VARCHAR, account_type VARCHAR)[]'
+			})
+		)
+	""", {"path": path}).fetch_arrow_table()
+
+	con.close()
+
+	os.makedirs(os.path.dirname(output_path), exist_ok=True)
+	pq.write_table(accounts_table.cast(ACCOUNTS_SCHEMA), output_path)
+
+	logging.info(f"Wrote {accounts_table.num_rows} accounts.")
 	logging.info("Done.")
 
-def aggregate_parquet_data():
+def get_partition_path(partition):
 	"""
-	Aggregates all parquet files in the /data/parquet directories into one single parquet file
-	each for tweets and accounts.
+	Returns the path of the parquet file for a year/month partition of the tweets dataset.
 
-	Parameters: N/A
+	Arguments:
+		partition (str): The partition key formatted as YYYY-MM
+	Returns:
+		str: Path to the partition parquet file
+	"""
+
+	year, month = partition.split("-")
+
+	return f"{TWEETS_DATASET_PATH}/year={year}/month={month}/tweets.parquet"
+
+def write_partition(partition, files, row_group_size=100000, compression="snappy"):
+	"""
+	Merges the daily parquet files of a partition into a single partition file. Rows are
+	streamed batch by batch and written in row groups of row_group_size, so memory use is
+	bounded by the row group size rather than the size of the partition.
+
+	Arguments:
+		partition (str): The partition key formatted as YYYY-MM
+		files (list): Paths of the daily parquet files in the partition
+		row_group_size (int): Number of rows per row group in the partition file
+		compression (str): Parquet compression codec of the partition file
+	Returns:
+		int: The number of rows written
+	"""
+
+	output = get_partition_path(partition)
+	os.makedirs(os.path.dirname(output), exist_ok=True)
+
+	batches = []
+	count_buffered = 0
+	count_rows = 0
+
+	# Write to a temporary file first so readers never see a partial partition
+	with pq.ParquetWriter(f"{output}.tmp", TWEETS_SCHEMA, compression=compression) as writer:
+		for current_file in files:
+			for batch in pq.ParquetFile(current_file).iter_batches(batch_size=row_group_size):
+				batches.append(batch)
+				count_buffered += batch.num_rows
+
+				# Flush full row groups and keep the remainder buffered
+				if count_buffered >= row_group_size:
+					table = pa.Table.from_batches(batches, schema=TWEETS_SCHEMA)
+					count_flushed = count_buffered - count_buffered % row_group_size
+
+					writer.write_table(table.slice(0, count_flushed), row_group_size=row_group_size)
+					batches = table.slice(count_flushed).to_batches()
+					count_buffered -= count_flushed
+					count_rows += count_flushed
+
+		if count_buffered:
+			writer.write_table(pa.Table.from_batches(batches, schema=TWEETS_SCHEMA), row_group_size=row_group_size)
+			count_rows += count_buffered
+
+	os.replace(f"{output}.tmp", output)
+
+	return count_rows
+
+def aggregate_parquet_data(row_group_size=100000, compression="snappy", force=False):
+	"""
+	Compacts the daily parquet files in the /data/parquet directory into a year/month
+	partitioned tweets dataset, and the accounts parquet files into a single parquet file.
+	Only partitions whose daily files were added, modified or removed since the last run
+	are rewritten, and the accounts file is only rewritten when the accounts parquet files
+	changed, so that load_duckdb does not reload unchanged accounts.
+
+	Arguments:
+		row_group_size (int): Number of rows per row group in the output files
+		compression (str): Parquet compression codec of the output files
+		force (bool): If enabled, all partitions are rewritten regardless of the manifest
 	Returns: N/A
 	"""
 
 	logging.info("Aggregating parquet data...")
 
-	pq.write_table(pq.ParquetDataset('./data/parquet/').read(), './data/tweets.parquet', row_group_size=100000)
-	pq.write_table(pq.ParquetDataset('./data/parquet/accounts').read(), './data/accounts.parquet', row_group_size=100000)
+	# Group the daily files by the year and month in their file name
+	partitions = {}
+
+	for current_file in sorted(glob.glob("./data/parquet/*.parquet")):
+		partitions.setdefault(os.path.basename(current_file)[:7], []).append(current_file)
+
+	manifest = {} if force else load_manifest(PARTITIONS_MANIFEST_PATH)
+
+	# Remove partitions whose daily files no longer exist
+	for partition in set(manifest) - set(partitions):
+		if os.path.exists(get_partition_path(partition)):
+			os.remove(get_partition_path(partition))
+		del manifest[partition]
+
+	# Rewrite the partitions whose daily files changed
+	for partition, files in partitions.items():
+		inputs = {current_file: os.stat(current_file).st_mtime for current_file in files}
+
+		if manifest.get(partition, {}).get("inputs") == inputs and os.path.exists(get_partition_path(partition)):
+			continue
+
+		count_rows = write_partition(partition, files, row_group_size, compression)
+		manifest[partition] = {"inputs": inputs, "rows": count_rows}
+		save_manifest(manifest, PARTITIONS_MANIFEST_PATH)
+
+		logging.debug(f"Wrote partition {partition} ({count_rows} tweets)")
+
+	save_manifest(manifest, PARTITIONS_MANIFEST_PATH)
+
+	# Rewrite the accounts file when the accounts parquet files changed
+	accounts_manifest = {} if force else load_manifest(ACCOUNTS_MANIFEST_PATH)
+	inputs = {current_file: os.stat(current_file).st_mtime for current_file in sorted(glob.glob("./data/parquet/accounts/*.parquet"))}
+
+	if accounts_manifest.get("inputs") != inputs or not os.path.exists(ACCOUNTS_PARQUET_PATH):
+		pq.write_table(pq.ParquetDataset('./data/parquet/accounts').read(), ACCOUNTS_PARQUET_PATH, row_group_size=row_group_size, compression=compression)
+		save_manifest({"inputs": inputs}, ACCOUNTS_MANIFEST_PATH)
+
+		logging.debug(f"Wrote {ACCOUNTS_PARQUET_PATH}")
 
 	logging.info("Done.")
 
 def read_parquet_data():
 	"""
-	Reads the aggregated parquet file into a pandas dataframe and prints a preview of the result.
+	Reads the first rows of the tweets dataset and the accounts parquet file into pandas
+	dataframes and prints a preview of the result.
 
 	Parameters: N/A
 	Returns: N/A
@@ -135,59 +1055,317 @@ def read_parquet_data():
 
 	logging.info("Reading parquet data...")
 
-	tweets_table = pq.read_table('./data/tweets.parquet')
-	df_tweets = tweets_table.to_pandas()
+	df_tweets = ds.dataset(TWEETS_DATASET_PATH, format="parquet", partitioning="hive").head(5).to_pandas()
 
-	accounts_table = pq.read_table('./data/accounts.parquet')
+	accounts_table = pq.read_table(ACCOUNTS_PARQUET_PATH)
 	df_accounts = accounts_table.to_pandas()
 
 	logging.info(f"Tweets data: {df_tweets.head()}")
 	logging.info(f"Accounts data: {df_accounts.head()}")
 
-def load_duckdb():
+def get_loaded_sources(database):
 	"""
-	Creates the tweets and accounts tables in the duckdb database from the parquet files.
+	Returns the parquet sources recorded as loaded in a duckdb database.
 
-	Parameters: N/A
+	Arguments:
+		database (str): Path to the duckdb database
+	Returns:
+		dict: The size and mtime of each loaded source keyed by path, empty if the
+			database does not exist or was built with a different DB_SCHEMA_VERSION
+	"""
+
+	if not os.path.exists(database):
+		return {}
+
+	con = duckdb.connect(database=database, read_only=True)
+
+	try:
+		schema_version = con.execute("SELECT schema_version FROM load_info").fetchone()[0]
+		rows = con.execute("SELECT path, size, mtime FROM load_log").fetchall() if schema_version == DB_SCHEMA_VERSION else []
+	except duckdb.CatalogException:
+		rows = []
+	finally:
+		con.close()
+
+	return {path: (size, mtime) for path, size, mtime in rows}
+
+def create_rollup_tables(con):
+	"""
+	Creates the pre-aggregated tables read by the dashboard. monthly_sentiment holds the
+	sentiment sum and the tweet counts per month, party, account type and account, so the
+	charts aggregate a few thousand rows instead of every tweet. extreme_tweets holds the
+	EXTREME_TWEETS_PER_MONTH most positive and most negative tweets per month, party and
+	account type. The most positive or negative tweets of any range of months are among
+	them, so the tweet examples are picked from a few hundred candidates.
+
+	Arguments:
+		con (duckdb.DuckDBPyConnection): Connection to the database being loaded
+	Returns: N/A
+	"""
+
+	con.execute("""--sql
+		CREATE OR REPLACE TABLE monthly_sentiment
+		AS SELECT
+			year_month,
+			party,
+			type,
+			account_key,
+			SUM(sentiment) AS sum_sentiment,
+			COUNT(*) AS count_tweets,
+			SUM(CASE WHEN sentiment >= 0.05 THEN 1 ELSE 0 END) AS count_pos,
+			SUM(CASE WHEN sentiment <= -0.05 THEN 1 ELSE 0 END) AS count_neg,
+			SUM(CASE WHEN sentiment < 0.05 AND sentiment > -0.05 THEN 1 ELSE 0 END) AS count_neu
+		FROM tweets
+		WHERE account_key IS NOT NULL
+		GROUP BY ALL
+	""")
+
+	con.execute(f"""--sql
+		CREATE OR REPLACE TABLE extreme_tweets
+		AS SELECT DISTINCT
+			year_month,
+			party,
+			type,
+			tweet.sentiment,
+			tweet.text,
+			tweet.link
+		FROM (
+			SELECT
+				year_month,
+				party,
+				type,
+				UNNEST(list_concat(
+					MAX_BY({{'sentiment': sentiment, 'text': text, 'link': link}}, sentiment, {int(EXTREME_TWEETS_PER_MONTH)}),
+					MIN_BY({{'sentiment': sentiment, 'text': text, 'link': link}}, sentiment, {int(EXTREME_TWEETS_PER_MONTH)})
+				)) AS tweet
+			FROM tweets
+			WHERE party IS NOT NULL
+				AND sentiment IS NOT NULL
+			GROUP BY ALL
+		)
+	""")
+
+def load_duckdb(force=False, row_group_size=DB_ROW_GROUP_SIZE):
+	"""
+	Loads the tweets and accounts tables in the duckdb database from the parquet files.
+	Only tweet partitions that are new or changed since the last load are read. Their
+	tweets replace any existing tweets with the same id, and accounts are upserted.
+
+	The database is built in a staging copy and moved into place once complete, so
+	readers never see a partially loaded database. Partitions that were deleted are only
+	removed from the database when rebuilding with force. Databases built with a
+	different DB_SCHEMA_VERSION are rebuilt from scratch.
+
+	Arguments:
+		force (bool): If enabled, the database is rebuilt from scratch
+		row_group_size (int): Number of rows per row group of the tweets table
 	Returns: N/A
 	"""
 
 	logging.info("Loading data into duckdb...")
 
-	con = duckdb.connect(database=DB_PATH)
+	staging_path = f"{DB_PATH}.staging"
+	loaded_sources = {} if force else get_loaded_sources(DB_PATH)
 
-	# Drop the existing tables before recreating
-	con.execute("DROP TABLE IF EXISTS tweets")
-	con.execute("DROP TABLE IF EXISTS accounts")
+	# Find the sources that changed since the last load, accounts first so that new
+	# tweets can be matched to their accounts
+	sources = [ACCOUNTS_PARQUET_PATH] + sorted(glob.glob(f"{TWEETS_DATASET_PATH}/*/*/*.parquet"))
+	changed_sources = []
 
-	# Create the tweets table
+	for source in sources:
+		stat = os.stat(source)
+
+		if loaded_sources.get(source) != (stat.st_size, stat.st_mtime):
+			changed_sources.append((source, stat.st_size, stat.st_mtime))
+
+	if not changed_sources:
+		logging.info("Database is up to date.")
+		return
+
+	# Start the staging database from the current one, unless rebuilding
+	for path in (staging_path, f"{staging_path}.wal"):
+		if os.path.exists(path):
+			os.remove(path)
+
+	if loaded_sources:
+		shutil.copyfile(DB_PATH, staging_path)
+
+	# Attach the staging database with the configured row group size for new row groups
+	con = duckdb.connect()
+	con.execute(f"ATTACH '{staging_path}' AS staging (ROW_GROUP_SIZE {int(row_group_size)})")
+	con.execute("USE staging")
+
+	# Party and account type are stored as enums, values outside the enums become NULL
+	con.execute(f"CREATE TYPE IF NOT EXISTS party_enum AS ENUM ({', '.join(repr(party) for party in PARTIES)})")
+	con.execute(f"CREATE TYPE IF NOT EXISTS account_type_enum AS ENUM ({', '.join(repr(account_type) for account_type in ACCOUNT_TYPES)})")
+
+	# Tweets carry the surrogate key, party and type of their account so the dashboard
+	# can filter them without joining accounts
 	con.execute("""--sql
-		CREATE OR REPLACE TABLE tweets
-		AS SELECT
-			user_id AS account_id,
-			screen_name,
-			text,
-			sentiment,
-			link,
-			STRPTIME(time, '%xT%X%z') AS created_at
-		FROM './data/tweets.parquet'
+		CREATE TABLE IF NOT EXISTS tweets (
+			id BIGINT,
+			account_id BIGINT,
+			account_key INTEGER,
+			party party_enum,
+			type account_type_enum,
+			screen_name VARCHAR,
+			text VARCHAR,
+			sentiment FLOAT,
+			link VARCHAR,
+			created_at TIMESTAMPTZ,
+			date DATE,
+			year_month INTEGER
+		)
 	""")
 
-	# Create the accounts table
 	con.execute("""--sql
-		CREATE OR REPLACE TABLE accounts
-		AS SELECT
-			id,
-			screen_name,
-			account_type,
-			name,
-			chamber,
-			type,
-			party,
-			state
-		FROM './data/accounts.parquet'
+		CREATE TABLE IF NOT EXISTS accounts (
+			id BIGINT PRIMARY KEY,
+			account_key INTEGER UNIQUE,
+			screen_name VARCHAR,
+			account_type VARCHAR,
+			name VARCHAR,
+			chamber VARCHAR,
+			type account_type_enum,
+			party party_enum,
+			state VARCHAR
+		)
 	""")
 
+	con.execute("""--sql
+		CREATE TABLE IF NOT EXISTS load_log (
+			path VARCHAR PRIMARY KEY,
+			size BIGINT,
+			mtime DOUBLE
+		)
+	""")
+
+	# Tweets are stored ordered by time so zone maps can skip row groups outside the
+	# filtered date range. Appending a partition newer than the remaining tweets keeps
+	# that order, such as the current month rewritten by a daily refresh. Loading a
+	# partition that overlaps them requires sorting the table again.
+	needs_sort = False
+
+	for source, size, mtime in changed_sources:
+		if source == ACCOUNTS_PARQUET_PATH:
+
+			# Assign surrogate keys to new accounts, existing accounts keep their key
+			con.execute("""--sql
+				INSERT INTO accounts (id, account_key)
+				SELECT
+					id,
+					(SELECT COALESCE(MAX(account_key), 0) FROM accounts) + ROW_NUMBER() OVER (ORDER BY id)
+				FROM (
+					SELECT DISTINCT CAST(id AS BIGINT) AS id
+					FROM read_parquet($source)
+					WHERE CAST(id AS BIGINT) NOT IN (SELECT id FROM accounts)
+				)
+			""", {"source": source})
+
+			# Update the account details and remove the accounts that are no longer listed
+			con.execute("""--sql
+				UPDATE accounts
+				SET
+					screen_name = source.screen_name,
+					account_type = source.account_type,
+					name = source.name,
+					chamber = source.chamber,
+					type = TRY_CAST(source.type AS account_type_enum),
+					party = TRY_CAST(source.party AS party_enum),
+					state = source.state
+				FROM read_parquet($source) AS source
+				WHERE accounts.id = CAST(source.id AS BIGINT)
+			""", {"source": source})
+
+			con.execute("""--sql
+				DELETE FROM accounts
+				WHERE id NOT IN (SELECT CAST(id AS BIGINT) FROM read_parquet($source))
+			""", {"source": source})
+
+			# Tweets of removed accounts lose their account columns, like the tweets of
+			# unknown accounts, so they drop out of every dashboard section
+			con.execute("""--sql
+				UPDATE tweets
+				SET
+					account_key = NULL,
+					party = NULL,
+					type = NULL
+				WHERE account_key IS NOT NULL
+					AND account_key NOT IN (SELECT account_key FROM accounts)
+			""")
+
+			# Refresh the account columns of tweets whose account changed
+			con.execute("""--sql
+				UPDATE tweets
+				SET
+					account_key = accounts.account_key,
+					party = accounts.party,
+					type = accounts.type
+				FROM accounts
+				WHERE tweets.account_id = accounts.id
+					AND (
+						tweets.account_key IS DISTINCT FROM accounts.account_key
+						OR tweets.party IS DISTINCT FROM accounts.party
+						OR tweets.type IS DISTINCT FROM accounts.type
+					)
+			""")
+
+		else:
+
+			# Replace existing tweets with the same id, keeping one row per id
+			con.execute("""--sql
+				DELETE FROM tweets
+				WHERE id IN (SELECT id FROM read_parquet($source))
+			""", {"source": source})
+
+			needs_sort = needs_sort or con.execute("""--sql
+				SELECT COALESCE(
+					(SELECT MIN(created_at) FROM read_parquet($source)) < (SELECT MAX(created_at) FROM tweets),
+					FALSE
+				)
+			""", {"source": source}).fetchone()[0]
+
+			con.execute("""--sql
+				INSERT INTO tweets
+				SELECT
+					source.id,
+					source.user_id AS account_id,
+					accounts.account_key,
+					accounts.party,
+					accounts.type,
+					source.screen_name,
+					source.text,
+					source.sentiment,
+					source.link,
+					source.created_at,
+					CAST(source.created_at AS DATE) AS date,
+					YEAR(source.created_at) * 100 + MONTH(source.created_at) AS year_month
+				FROM read_parquet($source) AS source
+					LEFT JOIN accounts ON accounts.id = source.user_id
+				QUALIFY ROW_NUMBER() OVER (PARTITION BY source.id) = 1
+				ORDER BY source.created_at, accounts.account_key
+			""", {"source": source})
+
+		con.execute("INSERT OR REPLACE INTO load_log VALUES ($path, $size, $mtime)", {"path": source, "size": size, "mtime": mtime})
+
+		logging.debug(f"Loaded {source}")
+
+	if needs_sort:
+		logging.info("Sorting tweets table...")
+		con.execute("CREATE OR REPLACE TABLE tweets AS SELECT * FROM tweets ORDER BY created_at, account_key")
+
+	# Rebuild the rollup tables from the loaded tweets
+	create_rollup_tables(con)
+
+	con.execute("CREATE OR REPLACE TABLE load_info AS SELECT $version AS schema_version", {"version": DB_SCHEMA_VERSION})
+
+	con.execute("CHECKPOINT staging")
+	con.close()
+
+	# Swap the staging database in
+	os.replace(staging_path, DB_PATH)
+
+	logging.info(f"Loaded {len(changed_sources)} changed sources.")
 	logging.info("Done.")
 
 def read_duckdb():
@@ -204,23 +1382,118 @@ def read_duckdb():
 
 	con.sql("SELECT * FROM tweets LIMIT 5").show()
 	con.sql("SELECT * FROM accounts LIMIT 5").show()
+	con.sql("SELECT * FROM monthly_sentiment LIMIT 5").show()
 
-if __name__ == '__main__':
+# Pipeline stages in the order they run, with the files they read and write. Every stage
+# also depends on this file, so a code change reruns the stages, which then only redo
+# the work their own manifests consider out of date.
+PIPELINE_STAGES = [
+	{
+		"name": "tweets",
+		"run": lambda force, workers: process_json_tweets_data(workers, force),
+		"inputs": ["./data/json", "./data/json/*.json"],
+		"outputs": [MANIFEST_PATH]
+	},
+	{
+		"name": "accounts",
+		"run": lambda force, workers: process_json_accounts_data(),
+		"inputs": [ACCOUNTS_JSON_PATH],
+		"outputs": [RAW_ACCOUNTS_PARQUET_PATH]
+	},
+	{
+		"name": "aggregate",
+		"run": lambda force, workers: aggregate_parquet_data(force=force),
+		"inputs": ["./data/parquet", "./data/parquet/*.parquet", RAW_ACCOUNTS_PARQUET_PATH],
+		"outputs": [PARTITIONS_MANIFEST_PATH, ACCOUNTS_MANIFEST_PATH, ACCOUNTS_PARQUET_PATH]
+	},
+	{
+		"name": "load",
+		"run": lambda force, workers: load_duckdb(force=force),
+		"inputs": [TWEETS_DATASET_PATH, f"{TWEETS_DATASET_PATH}/*/*/*.parquet", ACCOUNTS_PARQUET_PATH],
+		"outputs": [DB_PATH]
+	}
+]
 
-	# Process json tweet data
-	# process_json_tweets_data()
+def is_stage_up_to_date(stage, state):
+	"""
+	Checks whether a pipeline stage has to run. A stage is up to date when all its
+	outputs exist and it last completed, or its outputs were last written, after the
+	latest change to its inputs. Directories are inputs so that removed files count as a
+	change.
+
+	Arguments:
+		stage (dict): The stage, see PIPELINE_STAGES
+		state (dict): The completion time of each stage, see run_pipeline
+	Returns:
+		bool: Whether the stage can be skipped
+	"""
+
+	if not all(os.path.exists(output) for output in stage["outputs"]):
+		return False
+
+	inputs = [os.path.abspath(__file__)] + [path for pattern in stage["inputs"] for path in glob.glob(pattern)]
+	inputs_mtime = max(os.stat(path).st_mtime for path in inputs)
+	outputs_mtime = min(os.stat(output).st_mtime for output in stage["outputs"])
+
+	return max(outputs_mtime, state.get(stage["name"], 0)) >= inputs_mtime
+
+def run_pipeline(stages=None, force=False, workers=None):
+	"""
+	Runs the pipeline stages in order, skipping the stages that are up to date. The
+	completion time of each stage is saved to the pipeline state so that a stage whose
+	outputs did not need rewriting is not run again. Stages that process many files
+	checkpoint their own manifests, so an interrupted run resumes where it stopped.
+
+	Arguments:
+		stages (list): Names of the stages to run, all stages if None
+		force (bool): If enabled, the stages run and rebuild their outputs from scratch
+		workers (int): Number of worker processes scoring tweets
+	Returns:
+		dict: The wall time of each stage that ran, in seconds
+	"""
+
+	logging.info("Running pipeline...")
+
+	state = load_manifest(PIPELINE_STATE_PATH)
+	timings = {}
+
+	for stage in PIPELINE_STAGES:
+		if stages is not None and stage["name"] not in stages:
+			continue
+
+		if not force and is_stage_up_to_date(stage, state):
+			logging.info(f"Stage {stage['name']} is up to date, skipping")
+			continue
+
+		start_time = time.perf_counter()
+		stage["run"](force, workers)
+		timings[stage["name"]] = time.perf_counter() - start_time
+
+		state[stage["name"]] = time.time()
+		save_manifest(state, PIPELINE_STATE_PATH)
+
+		logging.info(f"Stage {stage['name']} took {timings[stage['name']]:.1f}s")
+
+	logging.info(f"Ran {len(timings)} stages in {sum(timings.values()):.1f}s")
+	logging.info("Done.")
+
+	return timings
+
+if __name__ == '__main__':
 
-	# Process json account data
-	# process_json_accounts_data()
+	parser = argparse.ArgumentParser(description="Runs the congress tweets data pipeline, skipping the stages that are up to date.")
+	parser.add_argument("stages", nargs="*", help=f"Stages to run, all stages by default: {', '.join(stage['name'] for stage in PIPELINE_STAGES)}")
+	parser.add_argument("--force", action="store_true", help="Run the stages even if up to date and rebuild their outputs from scratch")
+	parser.add_argument("--workers", type=int, default=None, help="Number of worker processes scoring tweets, defaults to the number of cores")
+	parser.add_argument("--show", action="store_true", help="Preview the duckdb database after running")
 
-	# Aggregate parquet data into one parquet file
-	# aggregate_parquet_data()
+	args = parser.parse_args()
 
-	# Read parquet data into pandas df
-	# read_parquet_data()
+	# argparse can't combine choices with an empty list of positional arguments
+	for name in set(args.stages) - {stage["name"] for stage in PIPELINE_STAGES}:
+		parser.error(f"unknown stage: {name}")
 
-	# Load the parquet data into the duckdb database
-	# load_duckdb()
+	run_pipeline(args.stages or None, args.force, args.workers)
 
-	# Read the data from the duckdb database
-	read_duckdb()
+	if args.show:
+		read_duckdb()